@@ -146,6 +146,7 @@
               ${pkgs.dockerTools.shadowSetup}
               groupadd -r orgahome
               useradd -r -g orgahome orgahome
+              mkdir -p -m 1777 /tmp
             '';
             enableFakechroot = true;
             config = {
@@ -0,0 +1,58 @@
+"""Benchmark loading the system emoji map from emoji.json versus the compiled table.
+
+Each loader runs in a fresh process, so the timings include everything a worker pays at startup.
+
+$ python hack/bench_emoji.py [--lookups 100000]
+"""
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+_CHILD = """
+import pathlib, resource, sys, time
+from orgahome import emoji
+
+def rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+names = list(emoji.parse_emoji_json())[::50]
+before = rss_kb()
+start = time.perf_counter()
+if sys.argv[1] == "json":
+    table = emoji.parse_emoji_json()
+else:
+    table = emoji.EmojiTable(pathlib.Path(sys.argv[1]))
+loaded = time.perf_counter()
+lookups = int(sys.argv[2])
+for i in range(lookups):
+    table[names[i % len(names)]]
+done = time.perf_counter()
+print(f"{(loaded - start) * 1000:8.2f} ms load  {(done - loaded) / lookups * 1e6:6.2f} us/lookup  "
+      f"{rss_kb() - before:6d} KiB RSS")
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    from orgahome import emoji
+
+    with tempfile.TemporaryDirectory() as tmp:
+        table_path = pathlib.Path(tmp) / emoji.EMOJI_TABLE_FILENAME
+        emoji.compile_emoji_table(table_path)
+        print(f"table:    {table_path.stat().st_size} bytes (emoji.json: {emoji.EMOJI_JSON_PATH.stat().st_size})")
+        for label, source in (("json", "json"), ("compiled", str(table_path))):
+            result = subprocess.run(
+                [sys.executable, "-c", _CHILD, source, str(args.lookups)], check=True, capture_output=True, text=True
+            )
+            print(f"{label + ':':9} {result.stdout.strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Benchmark loading every template from source versus from precompiled modules.
+
+$ python hack/bench_templates.py [--repeat 20]
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+
+from orgahome import templating
+
+
+def time_load(compiled_dir: pathlib.Path | None, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        templating.warm_templates(templating.make_templates(compiled_dir))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        compiled_dir = pathlib.Path(tmp)
+        templating.compile_templates(compiled_dir)
+        source = time_load(None, args.repeat)
+        compiled = time_load(compiled_dir, args.repeat)
+    print(f"source:    {source * 1000:.1f} ms")
+    print(f"compiled:  {compiled * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
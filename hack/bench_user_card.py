@@ -0,0 +1,138 @@
+"""Benchmark user card rendering and per-user memory for a synthetic directory.
+
+$ python hack/bench_user_card.py [--users 1000] [--renders 20] [--baseline REV]
+
+With --baseline, the benchmark first runs against orgahome as of the git revision REV, for comparison.
+"""
+
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from starlette.templating import Jinja2Templates
+
+from orgahome import services
+
+
+def synthetic_users(count: int) -> tuple[list[services.UFFDUser], list[services.MattermostUser]]:
+    uffd_users: list[services.UFFDUser] = []
+    mm_users: list[services.MattermostUser] = []
+    for i in range(count):
+        groups = [f"team_{j}" for j in range(i % 7, i % 7 + 3)] + ["orga", "mattermost_users"]
+        if i % 5 == 0:
+            groups.append(f"moderation_{i % 7}")
+        custom_status = ""
+        if i % 3 == 0:
+            emoji = "smile" if i % 2 else "partyparrot"
+            custom_status = json.dumps({"emoji": emoji, "text": f"Busy {i}", "duration": "", "expires_at": ""})
+        uffd_users.append(
+            {
+                "id": i,
+                "loginname": f"user{i}",
+                "email": f"user{i}@example.com",
+                "displayname": f"User {i}",
+                "groups": groups,
+            }
+        )
+        mm_users.append(
+            {
+                "id": f"{i:026d}",
+                "username": f"user{i}",
+                "first_name": f"First{i}",
+                "last_name": f"Last{i}",
+                "email": f"user{i}@example.com",
+                "position": "Volunteer" if i % 2 else "",
+                "props": {"idp/userid": str(i), "customStatus": custom_status},
+            }
+        )
+    return uffd_users, mm_users
+
+
+class _FakeUFFDClient:
+    def __init__(self, users: list[services.UFFDUser]) -> None:
+        self.users = users
+
+    async def get_users(self) -> list[services.UFFDUser]:
+        return self.users
+
+
+class _FakeMattermostClient:
+    def __init__(self, users: list[services.MattermostUser]) -> None:
+        self.users = users
+
+    async def get_all_active_users(self) -> list[services.MattermostUser]:
+        return self.users
+
+    async def sync_active_users(self) -> list[services.MattermostUser]:
+        return self.users
+
+
+def run_baseline(rev: str, users: int, renders: int) -> None:
+    """Runs this script against orgahome as of `rev`, checked out into a temporary worktree."""
+    repo = pathlib.Path(__file__).parent
+    with tempfile.TemporaryDirectory(prefix="orgahome-baseline-") as tmp:
+        subprocess.run(["git", "-C", str(repo), "worktree", "add", "--detach", tmp, rev], check=True)
+        try:
+            subprocess.run(
+                [sys.executable, __file__, "--users", str(users), "--renders", str(renders)],
+                env={**os.environ, "PYTHONPATH": tmp},
+                check=True,
+            )
+        finally:
+            subprocess.run(["git", "-C", str(repo), "worktree", "remove", "--force", tmp], check=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--renders", type=int, default=20)
+    parser.add_argument("--baseline", metavar="REV", help="also run against orgahome as of this git revision")
+    args = parser.parse_args()
+
+    if args.baseline:
+        print(f"baseline ({args.baseline}):")
+        run_baseline(args.baseline, args.users, args.renders)
+        print("current:")
+
+    services.get_system_emoji_map()
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    uffd_users, mm_users = synthetic_users(args.users)
+    uffd_client = _FakeUFFDClient(uffd_users)
+    mm_client = _FakeMattermostClient(mm_users)
+    directory = asyncio.run(services.fetch_directory_data(uffd_client, mm_client))  # ty: ignore[invalid-argument-type]
+    # The upstream payloads are only kept alive by the directory if the model holds on to them.
+    del uffd_users, mm_users, uffd_client, mm_client
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    users = list(directory.users.values())
+    print(f"memory:  {(after - before) / len(users):.0f} bytes/user ({len(users)} users)")
+
+    # From whichever orgahome was imported, which may be a baseline that predates orgahome.templating.
+    templates = Jinja2Templates(directory=pathlib.Path(inspect.getfile(services)).parent / "templates")
+    templates.env.globals["url_for"] = lambda name, **params: f"/user/{params['username']}"
+    # Macros are attributes of the template module, which the type checker can't know about.
+    user_card = getattr(templates.env.get_template("components/user_card.html").module, "user_card")
+
+    start = time.perf_counter()
+    for _ in range(args.renders):
+        for user in users:
+            user_card(user)
+    elapsed = time.perf_counter() - start
+    print(f"render:  {elapsed / (args.renders * len(users)) * 1e6:.1f} us/card")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
-import datetime
+import functools
 import logging
 import pathlib
-from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+import tempfile
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
 from typing import TypedDict
 
 import aiohttp
@@ -13,10 +14,22 @@ from starlette.middleware.sessions import SessionMiddleware
 from starlette.routing import Mount, Route, Router
 from starlette.templating import Jinja2Templates
 
-from orgahome import puppetdb, staticfiles
+from orgahome import conditional, puppetdb, staticfiles, templating
 from orgahome.config import Config
+from orgahome.fragments import FragmentCache
+from orgahome.imagecache import ImageCache
 from orgahome.middleware import AuthMiddleware
-from orgahome.services import MattermostClient, UFFDClient
+from orgahome.services import (
+    Directory,
+    MattermostClient,
+    UFFDClient,
+    dump_directory_data,
+    dump_emoji_ids,
+    fetch_directory_data,
+    load_directory_data,
+    load_emoji_ids,
+)
+from orgahome.snapshot import SharedSnapshotStore, SnapshotCache, content_version
 from orgahome.views import auth, directory, machines, proxy
 
 logger = logging.getLogger(__name__)
@@ -26,33 +39,36 @@ class State(TypedDict):
     client_session: aiohttp.ClientSession
     uffd_client: UFFDClient
     mm_client: MattermostClient
+    directory_cache: SnapshotCache[Directory]
+    machines_cache: SnapshotCache[puppetdb.MachineInventory]
     oauth: OAuth
+    image_cache: ImageCache
     templates: Jinja2Templates
+    site_version: str | None
     puppetdb_client: puppetdb.BasePuppetDBClient
 
 
-def _friendly_date(x: datetime.datetime) -> str:
-    now = datetime.datetime.now(datetime.timezone.utc)
-    ago = now - x
-    if ago.days < 1:
-        return x.strftime("%H:%M")
-    else:
-        return x.strftime("%Y-%m-%d %H:%M")
-
+def _shared_store[T](
+    name: str, dump: Callable[[T], bytes], load: Callable[[bytes], T]
+) -> SharedSnapshotStore[T] | None:
+    if not Config.ORGAHOME_SNAPSHOT_DIR:
+        return None
+    return SharedSnapshotStore(pathlib.Path(Config.ORGAHOME_SNAPSHOT_DIR) / f"{name}.json", dump, load)
 
-_SATURATIONS = [0.35, 0.5, 0.65]
-_LIGHTNESSES = [0.55, 0.65, 0.75]
 
-
-def _color_hash(val: str) -> str:
-    h = hash(val)
-    hue = h % 359
-    sat = _SATURATIONS[int(h / 360 % len(_SATURATIONS))]
-    lightness = _LIGHTNESSES[int(h / 360 / len(_SATURATIONS) % len(_LIGHTNESSES))]
-    return f"hsl({hue}, {sat * 100}%, {lightness * 100}%)"
+@contextmanager
+def _image_cache_dir() -> Iterator[pathlib.Path]:
+    if Config.IMAGE_CACHE_DIR:
+        yield pathlib.Path(Config.IMAGE_CACHE_DIR)
+    elif Config.ORGAHOME_SNAPSHOT_DIR:
+        # Shared between the workers, like the snapshots.
+        yield pathlib.Path(Config.ORGAHOME_SNAPSHOT_DIR) / "images"
+    else:
+        with tempfile.TemporaryDirectory(prefix="orgahome-images-") as path:
+            yield pathlib.Path(path)
 
 
-def lifespan_factory(static_files: staticfiles.StaticFilesBase):
+def lifespan_factory(static_files: staticfiles.StaticFilesBase, compiled_templates_dir: pathlib.Path | None = None):
     @asynccontextmanager
     async def lifespan(app: Starlette) -> AsyncIterator[State]:
         if not Config.MATTERMOST_API_URL or not Config.MATTERMOST_TOKEN:
@@ -64,11 +80,13 @@ def lifespan_factory(static_files: staticfiles.StaticFilesBase):
         if not Config.OIDC_CLIENT_ID or not Config.OIDC_CLIENT_SECRET:
             raise ValueError("OIDC_CLIENT_ID and OIDC_CLIENT_SECRET must be set")
 
-        templates = Jinja2Templates(directory=pathlib.Path(__file__).parent / "templates")
+        templates = templating.make_templates(compiled_templates_dir)
         static_files.register_template_functions(templates)
-        templates.env.filters["from_iso"] = lambda x: datetime.datetime.fromisoformat(x)
-        templates.env.filters["friendly_date"] = _friendly_date
-        templates.env.filters["color_hash"] = _color_hash
+        # Don't keep stale fragments around while editing templates.
+        FragmentCache(max_size=0 if app.debug else 4096).register_template_functions(templates)
+        if not app.debug:
+            templating.warm_templates(templates)
+        site_version = None if app.debug else conditional.site_version(templating.TEMPLATES_SOURCE_PATH, static_files)
 
         async with (
             aiohttp.ClientSession() as session,
@@ -80,8 +98,38 @@ def lifespan_factory(static_files: staticfiles.StaticFilesBase):
                 ssl_verify_hostname=Config.PUPPETDB_SSL_VERIFY_HOSTNAME,
             ) as puppetdb_client,
         ):
-            uffd_client = UFFDClient(session, Config.UFFD_API_URL, Config.UFFD_USER, Config.UFFD_PASSWORD)
-            mm_client = MattermostClient(session, Config.MATTERMOST_API_URL, Config.MATTERMOST_TOKEN)
+            uffd_client = UFFDClient(
+                session,
+                Config.UFFD_API_URL,
+                Config.UFFD_USER,
+                Config.UFFD_PASSWORD,
+                group=Config.UFFD_USERS_GROUP,
+            )
+            mm_client = MattermostClient(
+                session,
+                Config.MATTERMOST_API_URL,
+                Config.MATTERMOST_TOKEN,
+                per_page=Config.MATTERMOST_PAGE_SIZE,
+                page_concurrency=Config.MATTERMOST_PAGE_CONCURRENCY,
+                full_sync_interval=Config.MATTERMOST_FULL_SYNC_INTERVAL,
+                team_id=Config.MATTERMOST_TEAM_ID,
+                emoji_ttl=Config.MATTERMOST_EMOJI_TTL,
+                emoji_negative_ttl=Config.MATTERMOST_EMOJI_NEGATIVE_TTL,
+            )
+            directory_cache = SnapshotCache(
+                "directory",
+                functools.partial(fetch_directory_data, uffd_client, mm_client),
+                ttl=Config.DIRECTORY_CACHE_TTL,
+                store=_shared_store("directory", dump_directory_data, load_directory_data),
+                version=lambda data: content_version(dump_directory_data(data)),
+            )
+            machines_cache = SnapshotCache(
+                "machines",
+                functools.partial(puppetdb.fetch_machines_data, puppetdb_client),
+                ttl=Config.MACHINES_CACHE_TTL,
+                store=_shared_store("machines", puppetdb.dump_machines_data, puppetdb.load_machines_data),
+                version=lambda data: content_version(puppetdb.dump_machines_data(data)),
+            )
 
             oauth = OAuth()
             oauth.register(
@@ -92,14 +140,45 @@ def lifespan_factory(static_files: staticfiles.StaticFilesBase):
                 server_metadata_url=f"{Config.UFFD_URL}/.well-known/openid-configuration",
             )
 
-            yield {
-                "client_session": session,
-                "uffd_client": uffd_client,
-                "puppetdb_client": puppetdb_client,
-                "mm_client": mm_client,
-                "oauth": oauth,
-                "templates": templates,
-            }
+            async with AsyncExitStack() as stack:
+                image_cache = ImageCache(
+                    stack.enter_context(_image_cache_dir()),
+                    max_size=Config.IMAGE_CACHE_MAX_SIZE,
+                    fresh_for=Config.IMAGE_CACHE_FRESH_FOR,
+                    memory_items=Config.IMAGE_CACHE_MEMORY_ITEMS,
+                )
+
+                await stack.enter_async_context(
+                    directory_cache.background_refresh(interval=Config.DIRECTORY_REFRESH_INTERVAL)
+                )
+                if not isinstance(puppetdb_client, puppetdb.DummyPuppetDBClient):
+                    await stack.enter_async_context(
+                        machines_cache.background_refresh(interval=Config.MACHINES_REFRESH_INTERVAL)
+                    )
+                if Config.MATTERMOST_EMOJI_PREFETCH_INTERVAL:
+                    # Only the leader pages through Mattermost; the others fill their caches from its snapshot.
+                    emoji_prefetcher = SnapshotCache[dict[str, str]](
+                        "emoji",
+                        mm_client.prefetch_emoji_ids,
+                        ttl=Config.MATTERMOST_EMOJI_PREFETCH_INTERVAL,
+                        store=_shared_store("emoji", dump_emoji_ids, functools.partial(load_emoji_ids, mm_client)),
+                    )
+                    await stack.enter_async_context(
+                        emoji_prefetcher.background_refresh(interval=Config.MATTERMOST_EMOJI_PREFETCH_INTERVAL)
+                    )
+
+                yield {
+                    "client_session": session,
+                    "uffd_client": uffd_client,
+                    "puppetdb_client": puppetdb_client,
+                    "mm_client": mm_client,
+                    "directory_cache": directory_cache,
+                    "machines_cache": machines_cache,
+                    "image_cache": image_cache,
+                    "oauth": oauth,
+                    "templates": templates,
+                    "site_version": site_version,
+                }
 
     return lifespan
 
@@ -109,6 +188,9 @@ def create_app(debug: bool = False) -> Starlette:
         Route("/", endpoint=directory.index),
         Route("/team/{team_name}", endpoint=directory.index),
         Route("/user/{username}", endpoint=directory.user_detail),
+        Route("/api/directory", endpoint=directory.directory_api),
+        Route("/search", endpoint=directory.search),
+        Route("/api/search", endpoint=directory.search_api),
         Route("/mm_emoji/{emoji_name}", endpoint=proxy.mm_emoji_proxy),
         Route("/mm_avatar/{user_id}", endpoint=proxy.mm_avatar_proxy),
         Route("/machines", endpoint=machines.machines),
@@ -117,13 +199,19 @@ def create_app(debug: bool = False) -> Starlette:
     protected_router = Router(routes=protected_routes, middleware=[Middleware(AuthMiddleware)])  # ty: ignore[invalid-argument-type]
 
     static_files: staticfiles.StaticFilesBase
+    compiled_templates_dir: pathlib.Path | None = None
     if debug:
         static_files = staticfiles.DevelopmentStaticFiles()
     else:
-        serving_dir = pathlib.Path(Config.ORGAHOME_DIST_ROOT or staticfiles.STATIC_COMPILED_PATH)
+        dist_root = pathlib.Path(Config.ORGAHOME_DIST_ROOT or staticfiles.DIST_PATH)
+        serving_dir = dist_root / staticfiles.STATIC_DIRNAME
         if not serving_dir.exists():
             raise ValueError(f"Static files directory {serving_dir} does not exist")
         static_files = staticfiles.ManifestStaticFiles(serving_dir=serving_dir)
+        compiled_templates_dir = dist_root / templating.COMPILED_TEMPLATES_DIRNAME
+        if not compiled_templates_dir.exists():
+            logger.warning(f"No precompiled templates in {dist_root}; compiling them from source")
+            compiled_templates_dir = None
 
     routes = [
         Route("/authorize", endpoint=auth.authorize),
@@ -135,7 +223,12 @@ def create_app(debug: bool = False) -> Starlette:
         Middleware(SessionMiddleware, secret_key=Config.SECRET_KEY),  # ty: ignore[invalid-argument-type]
     ]
 
-    return Starlette(debug=debug, routes=routes, middleware=middleware, lifespan=lifespan_factory(static_files))
+    return Starlette(
+        debug=debug,
+        routes=routes,
+        middleware=middleware,
+        lifespan=lifespan_factory(static_files, compiled_templates_dir),
+    )
 
 
 def app() -> Starlette:
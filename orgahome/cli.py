@@ -1,11 +1,16 @@
+import contextlib
 import logging
 import multiprocessing
+import os
 import pathlib
 import shutil
+import tempfile
 
 import click
 import uvicorn
 
+logger = logging.getLogger(__name__)
+
 
 @click.group()
 def cli():
@@ -38,30 +43,49 @@ def uvicorn_command(host, port, workers, forwarded_allow_ips, debug):
         asgi_app = "orgahome.app:app"
         workers = default_workers() if workers is None else workers
         logging.basicConfig(level=logging.INFO)
-    uvicorn.run(
-        host=host,
-        port=port,
-        app=asgi_app,
-        factory=True,
-        reload=debug,
-        workers=workers,
-        forwarded_allow_ips=list(forwarded_allow_ips),
-    )
+
+    with contextlib.ExitStack() as stack:
+        if workers and workers > 1 and not os.environ.get("ORGAHOME_SNAPSHOT_DIR"):
+            # Let the workers share upstream snapshots rather than each fetching their own.
+            try:
+                snapshot_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="orgahome-"))
+            except OSError as e:
+                logger.warning(f"Not sharing snapshots between workers, no temporary directory: {e}")
+            else:
+                os.environ["ORGAHOME_SNAPSHOT_DIR"] = snapshot_dir
+
+        uvicorn.run(
+            host=host,
+            port=port,
+            app=asgi_app,
+            factory=True,
+            reload=debug,
+            workers=workers,
+            forwarded_allow_ips=list(forwarded_allow_ips),
+        )
 
 
 @cli.command("compilestatic")
 @click.option("-d", "--dest", type=pathlib.Path)
-def compilestatic_command(dest: pathlib.Path | None = None):
-    """Compile static files."""
-    from orgahome.staticfiles import STATIC_COMPILED_PATH, compile_static_files
+@click.option("--incremental", is_flag=True, default=False, help="Only reprocess files changed since the last build.")
+@click.option("-j", "--jobs", default=None, type=int)
+def compilestatic_command(dest: pathlib.Path | None = None, incremental: bool = False, jobs: int | None = None):
+    """Compile static files, templates and the emoji table."""
+    from orgahome.emoji import EMOJI_TABLE_FILENAME, compile_emoji_table
+    from orgahome.staticfiles import DIST_PATH, STATIC_DIRNAME, compile_static_files
+    from orgahome.templating import COMPILED_TEMPLATES_DIRNAME, compile_templates
 
-    dest = pathlib.Path(dest or STATIC_COMPILED_PATH)
+    dest = pathlib.Path(dest or DIST_PATH)
 
-    if dest.exists():
+    if dest.exists() and not incremental:
         shutil.rmtree(dest)
-    dest.mkdir()
+    (dest / STATIC_DIRNAME).mkdir(parents=True, exist_ok=True)
 
-    compile_static_files(dest_path=dest)
+    compile_static_files(dest_path=dest / STATIC_DIRNAME, incremental=incremental, max_workers=jobs)
+    # Templates are quick to compile, so always start afresh to drop any that were removed.
+    shutil.rmtree(dest / COMPILED_TEMPLATES_DIRNAME, ignore_errors=True)
+    compile_templates(dest_path=dest / COMPILED_TEMPLATES_DIRNAME)
+    compile_emoji_table(dest_path=dest / EMOJI_TABLE_FILENAME)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+"""Conditional GET support for pages rendered from snapshots."""
+
+import bisect
+import hashlib
+import pathlib
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from orgahome import staticfiles
+from orgahome.snapshot import Snapshot, content_version
+
+
+def site_version(templates_dir: pathlib.Path, static_files: staticfiles.StaticFilesBase) -> str | None:
+    """Returns a version covering the templates and static files, or None if they may change under us."""
+    if static_files.version is None:
+        return None
+    h = hashlib.sha256(static_files.version.encode("utf-8"))
+    for path in sorted(templates_dir.rglob("*")):
+        if path.is_file():
+            h.update(str(path.relative_to(templates_dir)).encode("utf-8") + b"\0")
+            h.update(path.read_bytes())
+    return content_version(h.digest())
+
+
+def page_etag(request: Request, snapshot: Snapshot, changes_at: list[float], *parts: object) -> str | None:
+    """Returns a strong ETag for a page rendered from `snapshot`, or None if it shouldn't have one.
+
+    As well as the snapshot version, this covers the site version, how many of the (sorted) times in
+    `changes_at` have passed, the base URL that url_for renders against, and any extra `parts`.
+    """
+    site_version = request.state.site_version
+    if site_version is None:
+        return None
+    changes = bisect.bisect_right(changes_at, time.time())
+    key = "\0".join(str(part) for part in (site_version, snapshot.version, changes, request.base_url, *parts))
+    return f'"{content_version(key.encode("utf-8"))}"'
+
+
+def cache_headers(etag: str | None) -> dict[str, str]:
+    if etag is None:
+        return {}
+    # Pages need a login, and the snapshot might have moved on, so always revalidate.
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(request: Request, etag: str | None, headers: dict[str, str] | None = None) -> Response | None:
+    """Returns a 304 response if the client already has the version of the page identified by `etag`.
+
+    The response carries `headers` if given, or else the usual page `cache_headers`.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if etag is None or not if_none_match:
+        return None
+    # If-None-Match uses weak comparison, and proxies that compress responses weaken ETags.
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers=cache_headers(etag) if headers is None else headers)
+    return None
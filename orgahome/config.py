@@ -8,6 +8,8 @@ dotenv.load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev_key")
     ORGAHOME_DIST_ROOT = os.environ.get("ORGAHOME_DIST_ROOT")
+    # Directory used to share upstream snapshots between worker processes (unset: don't share)
+    ORGAHOME_SNAPSHOT_DIR = os.environ.get("ORGAHOME_SNAPSHOT_DIR")
 
     # OIDC Configuration
     OIDC_CLIENT_SECRETS = os.environ.get("OIDC_CLIENT_SECRETS", "client_secrets.json")
@@ -20,10 +22,41 @@ class Config:
     UFFD_API_URL = os.environ.get("UFFD_API_URL", f"{UFFD_URL}/api/v1")
     UFFD_USER = os.environ.get("UFFD_USER")
     UFFD_PASSWORD = os.environ.get("UFFD_PASSWORD")
+    # If set, only members of this UFFD group are fetched for the directory
+    UFFD_USERS_GROUP = os.environ.get("UFFD_USERS_GROUP")
 
     # Mattermost API Configuration
     MATTERMOST_API_URL = os.environ.get("MATTERMOST_API_URL", "https://chat.orga.emfcamp.org/api/v4")
     MATTERMOST_TOKEN = os.environ.get("MATTERMOST_TOKEN")
+    # If set, only members of this Mattermost team are fetched for the directory
+    MATTERMOST_TEAM_ID = os.environ.get("MATTERMOST_TEAM_ID")
+    # Users per /users page (Mattermost caps this at 200), and how many pages to fetch at once
+    MATTERMOST_PAGE_SIZE = int(os.environ.get("MATTERMOST_PAGE_SIZE", "200"))
+    MATTERMOST_PAGE_CONCURRENCY = int(os.environ.get("MATTERMOST_PAGE_CONCURRENCY", "4"))
+    # Between full user syncs (in seconds), only users updated since the last sync are fetched
+    MATTERMOST_FULL_SYNC_INTERVAL = float(os.environ.get("MATTERMOST_FULL_SYNC_INTERVAL", "600"))
+    # How long (in seconds) custom emoji IDs are cached by name, and how long a missing emoji is remembered
+    MATTERMOST_EMOJI_TTL = float(os.environ.get("MATTERMOST_EMOJI_TTL", "3600"))
+    MATTERMOST_EMOJI_NEGATIVE_TTL = float(os.environ.get("MATTERMOST_EMOJI_NEGATIVE_TTL", "300"))
+    # How often (in seconds) every custom emoji ID is fetched in bulk to keep that cache warm (0: never)
+    MATTERMOST_EMOJI_PREFETCH_INTERVAL = float(os.environ.get("MATTERMOST_EMOJI_PREFETCH_INTERVAL", "1800"))
+
+    # How long (in seconds) a directory snapshot is served before it is refreshed in the background
+    DIRECTORY_CACHE_TTL = float(os.environ.get("DIRECTORY_CACHE_TTL", "60"))
+    # How often (in seconds) the directory snapshot is rebuilt by the background refresher
+    DIRECTORY_REFRESH_INTERVAL = float(os.environ.get("DIRECTORY_REFRESH_INTERVAL", "30"))
+    # Build the directory grid in the browser from /api/directory, rather than sending every card as HTML
+    DIRECTORY_CLIENT_RENDERING = os.environ.get("DIRECTORY_CLIENT_RENDERING") == "true"
+
+    # Directory for the cache of avatars and emoji proxied from Mattermost (unset: a subdirectory of
+    # ORGAHOME_SNAPSHOT_DIR if that's set, or else a temporary directory for each process)
+    IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR")
+    # How big (in bytes) the image cache may grow before the least recently used images are evicted
+    IMAGE_CACHE_MAX_SIZE = int(os.environ.get("IMAGE_CACHE_MAX_SIZE", str(256 * 1024 * 1024)))
+    # How long (in seconds) a cached image is served before it is revalidated with Mattermost
+    IMAGE_CACHE_FRESH_FOR = float(os.environ.get("IMAGE_CACHE_FRESH_FOR", "600"))
+    # How many small images each process also keeps in memory, on top of one avatar per directory user
+    IMAGE_CACHE_MEMORY_ITEMS = int(os.environ.get("IMAGE_CACHE_MEMORY_ITEMS", "256"))
 
     # PuppetDB Configuration
     PUPPETDB_API_URL = os.environ.get("PUPPETDB_API_URL")
@@ -31,3 +64,5 @@ class Config:
     PUPPETDB_CA_FILE = os.environ.get("PUPPETDB_CA_FILE")
     PUPPETDB_CERT_FILE = os.environ.get("PUPPETDB_CERT_FILE")
     PUPPETDB_KEY_FILE = os.environ.get("PUPPETDB_KEY_FILE")
+    MACHINES_CACHE_TTL = float(os.environ.get("MACHINES_CACHE_TTL", "120"))
+    MACHINES_REFRESH_INTERVAL = float(os.environ.get("MACHINES_REFRESH_INTERVAL", "60"))
@@ -0,0 +1,100 @@
+"""Mattermost system emoji names, compiled at build time into a table that loads without parsing.
+
+The table is a sorted list of (short name, unified codepoint) pairs, laid out so that it can be
+memory-mapped and binary searched in place. Every worker maps the same file, so it's only in
+memory once.
+
+    magic      8 bytes       TABLE_MAGIC
+    count      uint32 LE     number of entries
+    offsets    uint32 LE     count + 1 offsets of each entry from the start of the data
+    data                     each entry is b"<short name>\0<unified>", sorted by name (as UTF-8)
+"""
+
+import json
+import mmap
+import pathlib
+import struct
+import sys
+from collections.abc import Iterator, Mapping, Sequence
+
+EMOJI_JSON_PATH = pathlib.Path(__file__).parent / "emoji.json"
+# Under the compiled static files directory; hidden like the static manifest.
+EMOJI_TABLE_FILENAME = ".emoji.table"
+TABLE_MAGIC = b"orgaemj1"
+
+_HEADER = struct.Struct("<8sI")
+_OFFSET = struct.Struct("<I")
+
+
+def parse_emoji_json(path: pathlib.Path = EMOJI_JSON_PATH) -> dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    # Map short_name/underscores -> unicode codepoint
+    mapping = {}
+    for item in data:
+        unified = item.get("unified")
+        if unified:
+            for name in item.get("short_names", []):
+                mapping[name] = unified
+            if "short_name" in item:
+                mapping[item["short_name"]] = unified
+    return mapping
+
+
+def compile_emoji_table(dest_path: pathlib.Path, source_path: pathlib.Path = EMOJI_JSON_PATH) -> None:
+    entries = sorted(
+        (name.encode("utf-8"), unified.encode("ascii")) for name, unified in parse_emoji_json(source_path).items()
+    )
+    offsets = [0]
+    data = bytearray()
+    for name, unified in entries:
+        data += name + b"\0" + unified
+        offsets.append(len(data))
+    with open(dest_path, "wb") as f:
+        f.write(_HEADER.pack(TABLE_MAGIC, len(entries)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(data)
+
+
+class EmojiTable(Mapping[str, str]):
+    """Read-only short name -> unified codepoint mapping over a memory-mapped compiled table."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._map)
+        if magic != TABLE_MAGIC:
+            raise ValueError(f"{path} is not a compiled emoji table")
+        offsets_end = _HEADER.size + (self._count + 1) * _OFFSET.size
+        self._data_start = offsets_end
+        offsets = memoryview(self._map)[_HEADER.size : offsets_end]
+        # Offsets are little-endian; use them in place where that's the native order.
+        self._offsets: Sequence[int] = (
+            offsets.cast("I") if sys.byteorder == "little" else struct.unpack(f"<{self._count + 1}I", offsets)
+        )
+
+    def _entry(self, i: int) -> tuple[bytes, bytes]:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        name, _, unified = self._map[self._data_start + start : self._data_start + end].partition(b"\0")
+        return name, unified
+
+    def __getitem__(self, key: str) -> str:
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name, unified = self._entry(mid)
+            if name < target:
+                lo = mid + 1
+            elif name > target:
+                hi = mid
+            else:
+                return unified.decode("ascii")
+        raise KeyError(key)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self._entry(i)[0].decode("utf-8")
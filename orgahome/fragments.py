@@ -0,0 +1,80 @@
+"""Caching of rendered template fragments."""
+
+import datetime
+import logging
+import typing
+
+import jinja2
+import jinja2.runtime
+from markupsafe import Markup
+from starlette.templating import Jinja2Templates
+
+from orgahome.lru import LRUCache
+from orgahome.services import EnhancedUser
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """Caches rendered user cards.
+
+    Cards are keyed by everything they display (plus the macro arguments and the base URL that
+    url_for renders against), so a changed user simply misses and the stale card ages out of the
+    LRU. Cards showing a custom status also expire when the status does.
+    """
+
+    def __init__(self, max_size: int = 4096, report_every: int = 10_000) -> None:
+        self._cache: LRUCache[tuple[typing.Hashable, ...], Markup] = LRUCache(max_size)
+        self.report_every = report_every
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def register_template_functions(self, templates: Jinja2Templates) -> None:
+        @jinja2.pass_context
+        def cached_user_card(
+            context: jinja2.runtime.Context, macro: jinja2.runtime.Macro, user: EnhancedUser, **kwargs: typing.Any
+        ) -> Markup:
+            custom_status = user.custom_status
+            key = (
+                user.username,
+                user.display_name,
+                user.image_url,
+                user.position,
+                user.teams_json,
+                user.custom_status_emoji_url,
+                custom_status.get("text") if custom_status else None,
+                tuple(sorted(kwargs.items())),
+                str(context["request"].base_url),
+            )
+            return self.get_or_render(key, lambda: macro(user, **kwargs), self._status_ttl(user))
+
+        templates.env.globals["cached_user_card"] = cached_user_card
+
+    def get_or_render(
+        self, key: tuple[typing.Hashable, ...], render: typing.Callable[[], str], ttl: float | None = None
+    ) -> Markup:
+        fragment = self._cache.get(key)
+        if fragment is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            fragment = Markup(render())
+            self._cache.set(key, fragment, ttl=ttl)
+
+        if (self.hits + self.misses) % self.report_every == 0:
+            logger.info(
+                f"Fragment cache hit rate {self.hit_rate:.1%} "
+                f"({self.hits} hits, {self.misses} misses, {len(self._cache)} entries)"
+            )
+        return fragment
+
+    @staticmethod
+    def _status_ttl(user: EnhancedUser) -> float | None:
+        if not user.custom_status or not user.status_expires_at:
+            return None
+        return (user.status_expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
@@ -0,0 +1,315 @@
+"""Cache of images proxied from Mattermost, on disk with a small in-memory hot tier.
+
+Image bodies are stored under `blobs/` named by their hash, so an image that many keys share (say
+the default avatar) is only stored once; `keys/` maps each key to its blob and the validators
+upstream sent with it. Both are written to a temporary file and renamed into place, so worker
+processes can share a cache directory. Both are touched whenever they're used, and once the
+directory grows past its size limit the least recently used ones are evicted.
+"""
+
+import asyncio
+import dataclasses
+import hashlib
+import itertools
+import json
+import logging
+import os
+import pathlib
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import BinaryIO
+
+import anyio
+
+from orgahome.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Evicting down to a little below the limit means we don't have to rescan on every store.
+EVICTION_LOW_WATER = 0.9
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    digest: str
+    content_type: str
+    size: int
+    fetched_at: float  # time.time(), so that it means the same thing to every process
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+@dataclass(frozen=True)
+class FetchedImage:
+    body: bytes
+    content_type: str
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class ImageFetchError(Exception):
+    """Upstream answered with an error status."""
+
+    def __init__(self, status: int) -> None:
+        super().__init__(f"upstream returned {status}")
+        self.status = status
+
+
+# Fetches the image, conditionally on the validators of the cached copy if there is one; returns
+# None if upstream says that copy is still current.
+type ImageFetcher = Callable[[CachedImage | None], Awaitable[FetchedImage | None]]
+
+
+class ImageCache:
+    """Size-bounded cache of images, revalidated with upstream once they're older than `fresh_for`.
+
+    Concurrent requests for the same key share a single upstream fetch. If revalidation fails
+    because upstream is unreachable or erroring, the stale copy is served instead. Disk access
+    happens in worker threads, so a slow disk doesn't hold up the event loop.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        max_size: int,
+        fresh_for: float,
+        memory_items: int = 256,
+        memory_item_max_size: int = 64 * 1024,
+    ) -> None:
+        self.path = path
+        self.blobs_path = path / "blobs"
+        self.keys_path = path / "keys"
+        self.max_size = max_size
+        self.fresh_for = fresh_for
+        self.memory_item_max_size = memory_item_max_size
+        self.blobs_path.mkdir(parents=True, exist_ok=True)
+        self.keys_path.mkdir(parents=True, exist_ok=True)
+        self._memory: LRUCache[str, tuple[CachedImage, bytes]] = LRUCache(memory_items)
+        self._refreshes: dict[str, asyncio.Task[tuple[CachedImage, bytes | None]]] = {}
+        # Other processes store images too, so this is only an estimate between scans.
+        self._size = sum(size for _, size, _ in self._scan())
+        self._eviction: asyncio.Task[None] | None = None
+
+    def blob_path(self, image: CachedImage) -> pathlib.Path:
+        return self.blobs_path / image.digest[:2] / image.digest
+
+    def _key_path(self, key: str) -> pathlib.Path:
+        return self.keys_path / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json"
+
+    def reserve_memory(self, items: int) -> None:
+        """Makes room in memory for at least `items` images, e.g. one per avatar on a page."""
+        self._memory.max_size = max(self._memory.max_size, items)
+
+    async def get(
+        self, key: str, fetch: ImageFetcher, fresh_for: float | None = None
+    ) -> tuple[CachedImage, bytes | None]:
+        """Returns the image cached under `key`, fetching or revalidating it first if needed.
+
+        The body is returned too if it's held in memory; otherwise read it with `open_blob`.
+        `fresh_for` overrides the cache's own, e.g. with `math.inf` for keys whose image never
+        changes. Raises `ImageFetchError` if upstream says there is no such image.
+        """
+        if fresh_for is None:
+            fresh_for = self.fresh_for
+        cached = self._memory.get(key)
+        if cached is None:
+            cached = await anyio.to_thread.run_sync(self._load, key)
+        if cached is not None and cached[0].age < fresh_for:
+            return cached
+        task = self._refreshes.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refresh(key, fetch, fresh_for), name=f"image-{key}")
+            self._refreshes[key] = task
+            task.add_done_callback(lambda task: self._refresh_done(key, task))
+        try:
+            # Shield the shared task so that one cancelled caller doesn't cancel it for everyone.
+            return await asyncio.shield(task)
+        except ImageFetchError as e:
+            if cached is None or e.status < 500:
+                raise
+            logger.warning(f"Serving stale image for {key}: {e!r}")
+            return cached
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning(f"Serving stale image for {key}: {e!r}")
+            return cached
+
+    async def open_blob(
+        self, key: str, image: CachedImage, fetch: ImageFetcher, fresh_for: float | None = None
+    ) -> tuple[CachedImage, bytes | BinaryIO]:
+        """Opens the blob of `image`, as returned by `get` for `key`, to read its body from.
+
+        Once open it stays readable even if it's evicted. If it has been evicted already, say by
+        another process since `get` looked, the image is fetched again, and its body may then be
+        returned in memory instead.
+        """
+        try:
+            return image, await anyio.to_thread.run_sync(_open_binary, self.blob_path(image))
+        except FileNotFoundError:
+            logger.info(f"Image for {key} was evicted while in use, fetching it again")
+        await self.invalidate(key)
+        image, body = await self.get(key, fetch, fresh_for=fresh_for)
+        if body is not None:
+            return image, body
+        return image, await anyio.to_thread.run_sync(_open_binary, self.blob_path(image))
+
+    async def read_body(
+        self, key: str, image: CachedImage, fetch: ImageFetcher, fresh_for: float | None = None
+    ) -> tuple[CachedImage, bytes]:
+        """Like `open_blob`, but reads the whole body."""
+        image, body = await self.open_blob(key, image, fetch, fresh_for=fresh_for)
+        if isinstance(body, bytes):
+            return image, body
+        with body:
+            return image, await anyio.to_thread.run_sync(body.read)
+
+    async def invalidate(self, key: str) -> None:
+        """Forgets the image cached under `key`, so that the next `get` fetches it afresh."""
+        self._memory.pop(key)
+        await anyio.to_thread.run_sync(self._key_path(key).unlink, True)
+
+    def _refresh_done(self, key: str, task: asyncio.Task[tuple[CachedImage, bytes | None]]) -> None:
+        self._refreshes.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved by the callers, if any are still waiting
+
+    async def _refresh(self, key: str, fetch: ImageFetcher, fresh_for: float) -> tuple[CachedImage, bytes | None]:
+        # Another process may have revalidated it since we looked.
+        cached = await anyio.to_thread.run_sync(self._load, key)
+        if cached is None:
+            cached = self._memory.get(key)
+        elif cached[0].age < fresh_for:
+            return cached
+        try:
+            fetched = await fetch(cached[0] if cached is not None else None)
+        except ImageFetchError as e:
+            if e.status < 500:
+                await self.invalidate(key)
+            raise
+        if fetched is None:
+            if cached is None:
+                raise ValueError("upstream said an image we don't have is not modified")
+            # If we hold the body, store it again in case it was evicted while we held it in memory.
+            image, body = dataclasses.replace(cached[0], fetched_at=time.time()), cached[1]
+        else:
+            body = fetched.body
+            image = CachedImage(
+                digest=hashlib.sha256(body).hexdigest(),
+                content_type=fetched.content_type,
+                size=len(body),
+                fetched_at=time.time(),
+                etag=fetched.etag,
+                last_modified=fetched.last_modified,
+            )
+        self._size += await anyio.to_thread.run_sync(self._store, key, image, body)
+        if body is not None and image.size <= self.memory_item_max_size:
+            self._memory.set(key, (image, body))
+        else:
+            self._memory.pop(key)
+        if self._size > self.max_size and self._eviction is None:
+            self._eviction = asyncio.create_task(anyio.to_thread.run_sync(self._evict), name="image-cache-eviction")
+            self._eviction.add_done_callback(self._eviction_done)
+        return image, body
+
+    def _load(self, key: str) -> tuple[CachedImage, bytes | None] | None:
+        """Reads the image cached under `key` from disk, marking it as recently used. Runs in a thread."""
+        key_path = self._key_path(key)
+        image = _read_image(key_path)
+        if image is None:
+            return None
+        blob_path = self.blob_path(image)
+        try:
+            # Touch both, for eviction.
+            os.utime(blob_path)
+            os.utime(key_path)
+            body = blob_path.read_bytes() if image.size <= self.memory_item_max_size else None
+        except FileNotFoundError:
+            return None
+        if body is not None:
+            self._memory.set(key, (image, body))
+        return image, body
+
+    def _store(self, key: str, image: CachedImage, body: bytes | None) -> int:
+        """Writes the image to disk, returning how many bytes that added. Runs in a thread."""
+        added = 0
+        blob_path = self.blob_path(image)
+        if body is not None:
+            try:
+                os.utime(blob_path)
+            except FileNotFoundError:
+                blob_path.parent.mkdir(exist_ok=True)
+                _write_atomically(blob_path, body)
+                added += image.size
+        key_path = self._key_path(key)
+        data = json.dumps(dataclasses.asdict(image)).encode("utf-8")
+        if not key_path.exists():
+            added += len(data)
+        _write_atomically(key_path, data)
+        return added
+
+    def _eviction_done(self, task: asyncio.Task[None]) -> None:
+        self._eviction = None
+        if not task.cancelled() and (e := task.exception()):
+            logger.error(f"Failed to evict from image cache {self.path}: {e!r}")
+
+    def _scan(self) -> list[tuple[float, int, pathlib.Path]]:
+        """Returns the modification time, size and path of every blob and key file."""
+        entries = []
+        for path in itertools.chain(self.blobs_path.glob("*/*"), self.keys_path.glob("*.json")):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.name.endswith(".tmp"):
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        """Removes the least recently used blobs and keys until we're back under the limit. Runs in a thread."""
+        entries = sorted(self._scan())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_size * EVICTION_LOW_WATER
+        evicted = 0
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            evicted += 1
+        # Keys whose blob has gone would only ever be misses, so don't let them pile up.
+        for _, entry_size, path in entries[evicted:]:
+            if path.parent != self.keys_path:
+                continue
+            image = _read_image(path)
+            if image is None or not self.blob_path(image).exists():
+                path.unlink(missing_ok=True)
+                size -= entry_size
+                evicted += 1
+        self._size = size
+        logger.info(f"Evicted {evicted} images and keys from {self.path}, {size} bytes remain")
+
+
+def _read_image(key_path: pathlib.Path) -> CachedImage | None:
+    try:
+        return CachedImage(**json.loads(key_path.read_bytes()))
+    except FileNotFoundError:
+        return None
+    except ValueError, TypeError:
+        # Written by an incompatible version; treat it as missing.
+        return None
+
+
+def _open_binary(path: pathlib.Path) -> BinaryIO:
+    return path.open("rb")
+
+
+def _write_atomically(path: pathlib.Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
@@ -0,0 +1,110 @@
+"""Incremental decoding of large JSON arrays from upstream APIs."""
+
+import codecs
+import enum
+import json
+import re
+import typing
+from collections.abc import AsyncIterator, Callable
+
+import aiohttp
+
+_NON_WHITESPACE = re.compile(r"[^ \t\n\r]")
+_DECODER = json.JSONDecoder()
+_NUMBER_ENDS = {",", "]", " ", "\t", "\n", "\r"}
+
+
+class _State(enum.Enum):
+    START = 1
+    FIRST_ITEM_OR_END = 2
+    ITEM = 3
+    COMMA_OR_END = 4
+    DONE = 5
+
+
+class JSONArrayParser:
+    """Parses a top-level JSON array fed in arbitrary pieces, returning each item once it is complete.
+
+    Only the unparsed tail of the input is kept around, so memory use is bounded by the largest
+    single item rather than by the size of the whole array.
+    """
+
+    def __init__(self) -> None:
+        self._state = _State.START
+        self._buffer = ""
+
+    def feed(self, text: str, final: bool = False) -> list[typing.Any]:
+        buffer = self._buffer + text
+        pos = 0
+        items = []
+        while True:
+            next_token = _NON_WHITESPACE.search(buffer, pos)
+            if next_token is None:
+                pos = len(buffer)
+                break
+            pos = next_token.start()
+            match self._state:
+                case _State.START:
+                    if buffer[pos] != "[":
+                        raise json.JSONDecodeError("Expected a JSON array", buffer, pos)
+                    pos += 1
+                    self._state = _State.FIRST_ITEM_OR_END
+                case _State.FIRST_ITEM_OR_END if buffer[pos] == "]":
+                    pos += 1
+                    self._state = _State.DONE
+                case _State.FIRST_ITEM_OR_END | _State.ITEM:
+                    try:
+                        item, end = _DECODER.raw_decode(buffer, pos)
+                    except json.JSONDecodeError:
+                        if final:
+                            raise
+                        break  # wait for the rest of the item
+                    if not final and isinstance(item, int | float) and buffer[end : end + 1] not in _NUMBER_ENDS:
+                        break  # the number (e.g. "1" of "1.5e3") could carry on in the next piece
+                    items.append(item)
+                    pos = end
+                    self._state = _State.COMMA_OR_END
+                case _State.COMMA_OR_END:
+                    if buffer[pos] == ",":
+                        self._state = _State.ITEM
+                    elif buffer[pos] == "]":
+                        self._state = _State.DONE
+                    else:
+                        raise json.JSONDecodeError("Expected ',' or ']'", buffer, pos)
+                    pos += 1
+                case _State.DONE:
+                    raise json.JSONDecodeError("Extra data", buffer, pos)
+        self._buffer = buffer[pos:]
+        if final and self._state != _State.DONE:
+            raise json.JSONDecodeError("Unterminated array", buffer, pos)
+        return items
+
+
+async def iter_json_array(response: aiohttp.ClientResponse, chunk_size: int = 64 * 1024) -> AsyncIterator[typing.Any]:
+    decoder = codecs.getincrementaldecoder(response.get_encoding())()
+    parser = JSONArrayParser()
+    async for chunk in response.content.iter_chunked(chunk_size):
+        for item in parser.feed(decoder.decode(chunk)):
+            yield item
+    for item in parser.feed(decoder.decode(b"", final=True), final=True):
+        yield item
+
+
+async def load_json_array[T](response: aiohttp.ClientResponse, project: Callable[[typing.Any], T]) -> list[T]:
+    """Like `await response.json()` for a JSON array, but passes each item through `project` as it arrives."""
+    return [project(item) async for item in iter_json_array(response)]
+
+
+def projector[T](cls: type[T]) -> Callable[[typing.Any], T]:
+    """Returns a function trimming decoded JSON objects down to the keys declared by the TypedDict `cls`."""
+    hints = typing.get_type_hints(cls)
+    nested = {key: projector(hint) for key, hint in hints.items() if typing.is_typeddict(hint)}
+
+    def project(data: typing.Any) -> T:
+        if not isinstance(data, dict):
+            return data  # e.g. null
+        return typing.cast(
+            T, {key: nested[key](value) if key in nested else value for key, value in data.items() if key in hints}
+        )
+
+    return project
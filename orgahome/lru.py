@@ -0,0 +1,52 @@
+"""A small in-memory LRU cache."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache[K, V]:
+    """Thread-safe LRU cache holding at most `max_size` entries, each optionally with a TTL."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[K, tuple[V, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self._lookup(key) is not None
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        entry = self._lookup(key)
+        return default if entry is None else entry[0]
+
+    def _lookup(self, key: K) -> tuple[V, float | None] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at = entry[1]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
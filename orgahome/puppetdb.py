@@ -1,6 +1,9 @@
 """Minimal PuppetDB client."""
 
 import abc
+import asyncio
+import dataclasses
+import datetime
 import json
 import logging
 import ssl
@@ -9,6 +12,8 @@ from contextlib import asynccontextmanager
 
 import aiohttp
 
+from orgahome import jsonstream
+
 logger = logging.getLogger(__name__)
 
 
@@ -129,6 +134,72 @@ class BasePuppetDBClient(abc.ABC):
         pass
 
 
+@dataclasses.dataclass(frozen=True)
+class CombinedInfo:
+    inventory: PuppetInventoryHost
+    emf_info: EMFPuppetInfo | None
+    node: PuppetNode | None
+    catalog: PuppetCatalog | None
+    websites: list[str]
+
+    @property
+    def catalog_commit_hash(self) -> str | None:
+        if not self.catalog:
+            return None
+        return self.catalog["version"].split("-")[-1]
+
+
+@dataclasses.dataclass(frozen=True)
+class MachineInventory:
+    hosts: list[CombinedInfo]  # by certname
+    # When the page changes without the data changing (as POSIX timestamps, sorted): each host's
+    # last contact is shown as a time of day until it is a day old, and as a full date after that.
+    changes_at: list[float]
+
+    @classmethod
+    def build(cls, hosts: list[CombinedInfo]) -> MachineInventory:
+        changes_at = sorted(
+            (datetime.datetime.fromisoformat(host.node["report_timestamp"]) + datetime.timedelta(days=1)).timestamp()
+            for host in hosts
+            if host.node and host.node.get("report_timestamp")
+        )
+        return cls(hosts=hosts, changes_at=changes_at)
+
+
+async def fetch_machines_data(puppetdb_client: BasePuppetDBClient) -> MachineInventory:
+    inventory_task = puppetdb_client.query_inventory()
+    emf_info_task = puppetdb_client.query_emf_info()
+    nodes_task = puppetdb_client.query_nodes()
+    catalogs_task = puppetdb_client.query_catalogs()
+    websites_task = puppetdb_client.query_websites()
+    inventory, emf_info, nodes_list, catalogs_list, websites = await asyncio.gather(
+        inventory_task, emf_info_task, nodes_task, catalogs_task, websites_task
+    )
+    nodes = {node["certname"]: node for node in nodes_list}
+    catalogs = {catalog["certname"]: catalog for catalog in catalogs_list}
+
+    inventory.sort(key=lambda host: host["certname"])
+    hosts = [
+        CombinedInfo(
+            inventory=host,
+            emf_info=emf_info.get(host["certname"]),
+            node=nodes.get(host["certname"]),
+            catalog=catalogs.get(host["certname"]),
+            websites=websites.get(host["certname"], []),
+        )
+        for host in inventory
+    ]
+    return MachineInventory.build(hosts)
+
+
+def dump_machines_data(machines: MachineInventory) -> bytes:
+    return json.dumps([dataclasses.asdict(host) for host in machines.hosts]).encode("utf-8")
+
+
+def load_machines_data(data: bytes) -> MachineInventory:
+    return MachineInventory.build([CombinedInfo(**host) for host in json.loads(data)])
+
+
 class PuppetDBClientException(Exception):
     pass
 
@@ -136,6 +207,12 @@ class PuppetDBClientException(Exception):
 type PQL = list[str | PQL]
 
 
+# Catalogs in particular come with every resource and edge, none of which we use.
+_project_inventory_host = jsonstream.projector(PuppetInventoryHost)
+_project_node = jsonstream.projector(PuppetNode)
+_project_catalog = jsonstream.projector(PuppetCatalog)
+
+
 class PuppetDBClient(BasePuppetDBClient):
     def __init__(self, session: aiohttp.ClientSession):
         self.session = session
@@ -144,7 +221,7 @@ class PuppetDBClient(BasePuppetDBClient):
         try:
             async with self.session.get("/pdb/query/v4/inventory") as response:
                 response.raise_for_status()
-                return await response.json()
+                return await jsonstream.load_json_array(response, _project_inventory_host)
         except aiohttp.ClientError as e:
             raise PuppetDBClientException(f"Failed to fetch inventory from PuppetDB: {e}") from e
 
@@ -183,7 +260,7 @@ class PuppetDBClient(BasePuppetDBClient):
         try:
             async with self.session.get("/pdb/query/v4/nodes") as response:
                 response.raise_for_status()
-                return await response.json()
+                return await jsonstream.load_json_array(response, _project_node)
         except aiohttp.ClientError as e:
             raise PuppetDBClientException(f"Failed to fetch nodes from PuppetDB: {e}") from e
 
@@ -191,7 +268,7 @@ class PuppetDBClient(BasePuppetDBClient):
         try:
             async with self.session.get("/pdb/query/v4/catalogs") as response:
                 response.raise_for_status()
-                return await response.json()
+                return await jsonstream.load_json_array(response, _project_catalog)
         except aiohttp.ClientError as e:
             raise PuppetDBClientException(f"Failed to fetch catalogs from PuppetDB: {e}") from e
 
@@ -0,0 +1,150 @@
+"""In-memory search index for the directory."""
+
+import bisect
+import dataclasses
+import re
+import unicodedata
+from collections.abc import Sequence
+
+from orgahome.lru import LRUCache
+
+_WORD = re.compile(r"\w+")
+
+# Terms this short match so many words that their matches are worked out up front.
+_SHORT_PREFIX = 2
+
+# How well a query term matched a document; lower is better.
+NAME_PREFIX = 0  # a word of a name field starts with the term
+OTHER_PREFIX = 1  # a word of another field starts with the term
+SUBSTRING = 2  # the term appears somewhere else in a word
+
+
+def normalize(text: str) -> str:
+    """Case-folds `text` and strips accents, so "José" is found by "jose"."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(normalize(text))
+
+
+def _trigrams(word: str) -> set[str]:
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+@dataclasses.dataclass(frozen=True)
+class SearchIndex:
+    """Word prefix and trigram index over a sequence of documents.
+
+    Each document is a pair of (name fields, other fields); matches on names rank above the rest.
+    Results are document indexes, so callers keep their own list of whatever was indexed.
+    """
+
+    # Every distinct word, sorted, so the words starting with a prefix are a contiguous range.
+    words: list[str]
+    # For each entry in `words`, the best (lowest) match rank of that word by document.
+    postings: list[dict[int, int]]
+    # The best match rank by document for every word prefix up to _SHORT_PREFIX characters long.
+    short_prefixes: dict[str, dict[int, int]]
+    # Document indexes by each trigram of their words, for terms that aren't a word prefix.
+    trigrams: dict[str, frozenset[int]]
+    # Each document's words joined by spaces, to confirm trigram candidates.
+    texts: list[str]
+    # Matches for recent longer terms; typing a query repeats the same terms over and over.
+    _term_cache: LRUCache[str, dict[int, int]] = dataclasses.field(
+        default_factory=lambda: LRUCache(256), compare=False, repr=False
+    )
+
+    @classmethod
+    def build(cls, documents: Sequence[tuple[Sequence[str], Sequence[str]]]) -> SearchIndex:
+        by_word: dict[str, dict[int, int]] = {}
+        short_prefixes: dict[str, dict[int, int]] = {}
+        trigrams: dict[str, set[int]] = {}
+        texts: list[str] = []
+        for doc, (names, others) in enumerate(documents):
+            doc_words: dict[str, int] = {}
+            for rank, fields in ((NAME_PREFIX, names), (OTHER_PREFIX, others)):
+                for field in fields:
+                    for word in _words(field):
+                        doc_words.setdefault(word, rank)
+            doc_trigrams: set[str] = set()
+            for word, rank in doc_words.items():
+                by_word.setdefault(word, {})[doc] = rank
+                for length in range(1, min(len(word), _SHORT_PREFIX) + 1):
+                    prefix_docs = short_prefixes.setdefault(word[:length], {})
+                    prefix_docs[doc] = min(prefix_docs.get(doc, rank), rank)
+                doc_trigrams.update(_trigrams(word))
+            for trigram in doc_trigrams:
+                trigrams.setdefault(trigram, set()).add(doc)
+            texts.append(" ".join(doc_words))
+
+        words = sorted(by_word)
+        return cls(
+            words=words,
+            postings=[by_word[word] for word in words],
+            short_prefixes=short_prefixes,
+            trigrams={trigram: frozenset(docs) for trigram, docs in trigrams.items()},
+            texts=texts,
+        )
+
+    def _match_term(self, term: str) -> dict[int, int]:
+        """Returns the rank of each document matching `term`. The result must not be modified."""
+        if len(term) <= _SHORT_PREFIX:
+            return self.short_prefixes.get(term, {})
+        matches = self._term_cache.get(term)
+        if matches is not None:
+            return matches
+
+        matches = {}
+        start = bisect.bisect_left(self.words, term)
+        end = bisect.bisect_left(self.words, term + "\U0010ffff", lo=start)
+        for word_docs in self.postings[start:end]:
+            for doc, rank in word_docs.items():
+                if rank < matches.get(doc, SUBSTRING + 1):
+                    matches[doc] = rank
+
+        # Rarest trigram first, so the intersection shrinks as quickly as possible.
+        postings = sorted(
+            (self.trigrams.get(trigram, frozenset()) for trigram in _trigrams(term)), key=lambda docs: len(docs)
+        )
+        candidates = set(postings[0]).intersection(*postings[1:])
+        for doc in candidates - matches.keys():
+            if term in self.texts[doc]:
+                matches[doc] = SUBSTRING
+        self._term_cache.set(term, matches)
+        return matches
+
+    def search(self, query: str, limit: int | None = None) -> list[int]:
+        """Returns the indexes of documents matching every word of `query`, best match first.
+
+        Ties keep document order.
+        """
+        terms = _words(query)
+        if not terms:
+            return []
+
+        scores: dict[int, int] | None = None
+        # Longest term first: it usually matches the fewest documents.
+        for term in sorted(terms, key=lambda term: len(term), reverse=True):
+            matches = self._match_term(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {doc: score + matches[doc] for doc, score in scores.items() if doc in matches}
+            if not scores:
+                return []
+
+        # Scores are small integers, so bucket by score rather than sorting every match; with a
+        # limit, usually only the best bucket or two need sorting.
+        buckets: dict[int, list[int]] = {}
+        for doc, score in (scores or {}).items():
+            buckets.setdefault(score, []).append(doc)
+        results: list[int] = []
+        for score in sorted(buckets):
+            results.extend(sorted(buckets[score]))
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
@@ -3,33 +3,34 @@ import datetime
 import functools
 import json
 import logging
-import os
+import pathlib
+import time
+import typing
+from collections.abc import Iterable, Mapping
 from dataclasses import asdict, dataclass
-from typing import TypedDict
+from typing import NotRequired, TypedDict
 
 import aiohttp
 import starlette.requests
 
+from orgahome import jsonstream
+from orgahome.config import Config
+from orgahome.emoji import EMOJI_TABLE_FILENAME, EmojiTable, parse_emoji_json
+from orgahome.lru import LRUCache
+from orgahome.search import SearchIndex
+from orgahome.staticfiles import DIST_PATH
+
 logger = logging.getLogger(__name__)
 
 
 @functools.cache
-def get_system_emoji_map() -> dict[str, str]:
+def get_system_emoji_map() -> Mapping[str, str]:
+    table_path = pathlib.Path(Config.ORGAHOME_DIST_ROOT or DIST_PATH) / EMOJI_TABLE_FILENAME
     try:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        emoji_path = os.path.join(base_dir, "emoji.json")
-        with open(emoji_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # Map short_name/underscores -> unicode codepoint
-        mapping = {}
-        for item in data:
-            unified = item.get("unified")
-            if unified:
-                for name in item.get("short_names", []):
-                    mapping[name] = unified
-                if "short_name" in item:
-                    mapping[item["short_name"]] = unified
-        return mapping
+        if table_path.exists():
+            return EmojiTable(table_path)
+        # Not built by compilestatic (e.g. in development), so parse the source instead.
+        return parse_emoji_json()
     except Exception as e:
         logger.error(f"Failed to fetch system emoji map: {e}")
         return {}
@@ -43,21 +44,53 @@ class UFFDUser(TypedDict):
     groups: list[str]
 
 
+_project_uffd_user = jsonstream.projector(UFFDUser)
+
+
 class UFFDClient:
-    def __init__(self, session: aiohttp.ClientSession, api_url: str, username: str, password: str) -> None:
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        api_url: str,
+        username: str,
+        password: str,
+        group: str | None = None,
+    ) -> None:
         self.session = session
         self.api_url: str = api_url.rstrip("/")
         self.auth = aiohttp.BasicAuth(username, password)
+        # If set, only members of this group are returned by get_users.
+        self.group = group
+
+        # The last getusers response, for revalidating with conditional requests.
+        self._users: list[UFFDUser] | None = None
+        self._etag: str | None = None
+        self._last_modified: str | None = None
 
     async def get_users(self) -> list[UFFDUser]:
-        try:
-            async with self.session.get(f"{self.api_url}/getusers", auth=self.auth) as response:
-                response.raise_for_status()
-                data = await response.json()
-                return data
-        except aiohttp.ClientError as e:
-            logger.error(f"Error fetching users from UFFD: {e}")
-            return []
+        """Fetches every user (in `group`, if set).
+
+        Raises aiohttp.ClientError on failure, rather than returning an empty list that would look
+        like an empty directory.
+        """
+        params = {"group": self.group} if self.group else {}
+        headers = {}
+        if self._users is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+        async with self.session.get(
+            f"{self.api_url}/getusers", auth=self.auth, params=params, headers=headers
+        ) as response:
+            if response.status == 304 and self._users is not None:
+                return self._users
+            response.raise_for_status()
+            data = await jsonstream.load_json_array(response, _project_uffd_user)
+            self._users = data
+            self._etag = response.headers.get("ETag")
+            self._last_modified = response.headers.get("Last-Modified")
+            return data
 
     @staticmethod
     def from_request(request: starlette.requests.HTTPConnection) -> UFFDClient:
@@ -82,52 +115,203 @@ class MattermostUser(TypedDict):
     email: str
     position: str
     props: MattermostUserProps
+    update_at: NotRequired[int]  # ms since epoch
+    delete_at: NotRequired[int]  # ms since epoch, or 0 if the user is active
+    last_picture_update: NotRequired[int]  # ms since epoch; missing if the user never set a picture
+
+
+_project_mattermost_user = jsonstream.projector(MattermostUser)
+
+
+class MattermostEmoji(TypedDict):
+    id: str
+    name: str
+
+
+_project_mattermost_emoji = jsonstream.projector(MattermostEmoji)
+
+
+def _idp_user_id(user: MattermostUser) -> str | None:
+    return user.get("props", {}).get("idp/userid")
+
+
+# How many ids to send in each /users/ids request.
+_USER_IDS_CHUNK = 1000
+# Mattermost returns at most this many items per page, however many are asked for. Paging stops at
+# the first short page, so asking for more would stop after the first.
+_MAX_PER_PAGE = 200
 
 
 class MattermostClient:
-    def __init__(self, session: aiohttp.ClientSession, api_url: str, token: str) -> None:
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        api_url: str,
+        token: str,
+        per_page: int = 200,
+        page_concurrency: int = 4,
+        full_sync_interval: float = 0,
+        team_id: str | None = None,
+        emoji_cache_size: int = 8192,
+        emoji_ttl: float = 3600,
+        emoji_negative_ttl: float = 300,
+    ) -> None:
         self.session = session
         self.api_url: str = api_url.rstrip("/")
         self.headers: dict[str, str] = {"Authorization": f"Bearer {token}"}
-
-    async def get_all_active_users(self) -> list[MattermostUser]:
+        # Paging would never end with less than one item per page, or one page at a time.
+        self.per_page = max(1, min(per_page, _MAX_PER_PAGE))
+        self.page_concurrency = max(1, page_concurrency)
+        self.full_sync_interval = full_sync_interval
+        # If set, only members of this team are listed.
+        self.team_id = team_id
+
+        # State for sync_active_users.
+        self._user_store: dict[str, MattermostUser] | None = None
+        self._last_full_sync = 0.0
+        self._last_update_at = 0
+
+        # Custom emoji IDs by name, with "" recording that there's no such emoji.
+        self._emoji_ids: LRUCache[str, str] = LRUCache(emoji_cache_size)
+        self._emoji_lookups: dict[str, asyncio.Task[str | None]] = {}
+        self.emoji_ttl = emoji_ttl
+        self.emoji_negative_ttl = emoji_negative_ttl
+
+    async def _get_active_users_page(self, page: int) -> list[MattermostUser]:
+        params = {"page": str(page), "per_page": str(self.per_page), "active": "true"}
+        if self.team_id:
+            params["in_team"] = self.team_id
+        async with self.session.get(f"{self.api_url}/users", headers=self.headers, params=params) as response:
+            response.raise_for_status()
+            return await jsonstream.load_json_array(response, _project_mattermost_user)
+
+    async def _fetch_all_active_users(self) -> list[MattermostUser]:
+        # Fetch the first page on its own, since that's all a small instance has. After that we
+        # speculatively request page_concurrency pages at a time until one of them comes back short.
         users: list[MattermostUser] = []
         page = 0
-        per_page = 200
+        batch_size = 1
         while True:
-            try:
-                async with self.session.get(
-                    f"{self.api_url}/users",
-                    headers=self.headers,
-                    params={"page": str(page), "per_page": str(per_page), "active": "true"},
-                ) as response:
-                    response.raise_for_status()
-                    batch = await response.json()
-                    if not batch:
-                        break
-                    users.extend(batch)
-                    if len(batch) < per_page:
-                        break
-                    page += 1
-            except aiohttp.ClientError as e:
-                logger.error(f"Error fetching users page {page}: {e}")
-                break
-        return users
+            pages = range(page, page + batch_size)
+            batches = await asyncio.gather(*(self._get_active_users_page(p) for p in pages))
+            for batch in batches:
+                users.extend(batch)
+                if len(batch) < self.per_page:
+                    return users
+            page = pages.stop
+            batch_size = self.page_concurrency
+
+    async def get_all_active_users(self) -> list[MattermostUser]:
+        try:
+            return await self._fetch_all_active_users()
+        except aiohttp.ClientError as e:
+            logger.error(f"Error fetching users: {e}")
+            return []
+
+    async def get_users_by_ids(self, user_ids: list[str], since: int = 0) -> list[MattermostUser]:
+        """Fetches the given users, skipping any not modified after `since` (ms since epoch)."""
+        chunks = [user_ids[i : i + _USER_IDS_CHUNK] for i in range(0, len(user_ids), _USER_IDS_CHUNK)]
+        params = {"since": str(since)} if since else {}
+
+        async def get_chunk(chunk: list[str]) -> list[MattermostUser]:
+            async with self.session.post(
+                f"{self.api_url}/users/ids", headers=self.headers, params=params, json=chunk
+            ) as response:
+                response.raise_for_status()
+                return await jsonstream.load_json_array(response, _project_mattermost_user)
+
+        batches = await asyncio.gather(*(get_chunk(chunk) for chunk in chunks))
+        return [user for batch in batches for user in batch]
+
+    async def sync_active_users(self) -> list[MattermostUser]:
+        """Returns all active users, only fetching those that changed since the previous call.
+
+        New users only show up at the next full sync (every `full_sync_interval` seconds), which also
+        catches anything the incremental updates might have missed. Unlike get_all_active_users, this
+        raises aiohttp.ClientError on failure rather than returning an incomplete list.
+
+        Users that aren't linked to an identity provider account can never appear in the directory,
+        so they are left out of the store (and the incremental requests) entirely.
+        """
+        now = time.monotonic()
+        if self._user_store is None or now - self._last_full_sync >= self.full_sync_interval:
+            users = await self._fetch_all_active_users()
+            self._user_store = {user["id"]: user for user in users if _idp_user_id(user)}
+            self._last_full_sync = now
+            self._last_update_at = 0
+            logger.debug(f"Full sync of {len(users)} Mattermost users")
+        else:
+            # Re-request anything updated in the same millisecond as the newest user we've seen, in
+            # case a second update landed in that millisecond after we fetched.
+            users = await self.get_users_by_ids(list(self._user_store), since=self._last_update_at - 1)
+            for user in users:
+                if user.get("delete_at") or not _idp_user_id(user):
+                    self._user_store.pop(user["id"], None)
+                else:
+                    self._user_store[user["id"]] = user
+            logger.debug(f"Incremental sync of Mattermost users: {len(users)} changed")
+
+        self._last_update_at = max([self._last_update_at, *(user.get("update_at", 0) for user in users)])
+        return list(self._user_store.values())
 
     def get_user_image_url(self, user_id: str) -> str:
         return f"{self.api_url}/users/{user_id}/image"
 
     async def get_emoji_id_by_name(self, emoji_name: str) -> str | None:
+        cached = self._emoji_ids.get(emoji_name)
+        if cached is not None:
+            return cached or None
+        # A page full of cards can ask for the same emoji many times at once; only look it up once.
+        lookup = self._emoji_lookups.get(emoji_name)
+        if lookup is None:
+            lookup = asyncio.create_task(self._fetch_emoji_id_by_name(emoji_name))
+            self._emoji_lookups[emoji_name] = lookup
+            lookup.add_done_callback(lambda _: self._emoji_lookups.pop(emoji_name, None))
+        return await asyncio.shield(lookup)
+
+    async def _fetch_emoji_id_by_name(self, emoji_name: str) -> str | None:
         try:
             async with self.session.get(f"{self.api_url}/emoji/name/{emoji_name}", headers=self.headers) as response:
                 if response.status == 404:
+                    self._emoji_ids.set(emoji_name, "", ttl=self.emoji_negative_ttl)
                     return None
                 response.raise_for_status()
                 data = await response.json()
-                return data.get("id")
+                emoji_id = data.get("id")
         except aiohttp.ClientError as e:
             logger.error(f"Error fetching emoji {emoji_name}: {e}")
             return None
+        if emoji_id:
+            self._emoji_ids.set(emoji_name, emoji_id, ttl=self.emoji_ttl)
+        return emoji_id
+
+    async def _get_custom_emoji_page(self, page: int) -> list[MattermostEmoji]:
+        params = {"page": str(page), "per_page": str(self.per_page), "sort": "name"}
+        async with self.session.get(f"{self.api_url}/emoji", headers=self.headers, params=params) as response:
+            response.raise_for_status()
+            return await jsonstream.load_json_array(response, _project_mattermost_emoji)
+
+    async def prefetch_emoji_ids(self) -> dict[str, str]:
+        """Pages through every custom emoji, so that lookups by name are answered from the cache.
+
+        Returns the emoji IDs by name. Raises if Mattermost can't be reached.
+        """
+        emoji_ids: dict[str, str] = {}
+        page = 0
+        while True:
+            emojis = await self._get_custom_emoji_page(page)
+            for emoji in emojis:
+                emoji_ids[emoji["name"]] = emoji["id"]
+            if len(emojis) < self.per_page:
+                break
+            page += 1
+        self.cache_emoji_ids(emoji_ids)
+        return emoji_ids
+
+    def cache_emoji_ids(self, emoji_ids: dict[str, str]) -> None:
+        """Caches emoji IDs by name, e.g. as prefetched by another process."""
+        for name, emoji_id in emoji_ids.items():
+            self._emoji_ids.set(name, emoji_id, ttl=self.emoji_ttl)
 
     def get_custom_emoji_image_url(self, emoji_id: str) -> str:
         return f"{self.api_url}/emoji/{emoji_id}/image"
@@ -144,124 +328,248 @@ class MattermostCustomStatus(TypedDict):
     expires_at: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TeamMembership:
     team_name: str
     is_lead: bool
 
 
-@dataclass(frozen=True)
-class EnhancedUser:
-    uffd: UFFDUser
-    mm: MattermostUser
+# There are only a handful of distinct memberships, so every user shares the same instances.
+_team_membership = functools.cache(TeamMembership)
 
-    @property
-    def display_name(self) -> str:
-        first = self.mm.get("first_name")
-        last = self.mm.get("last_name")
-        if first and last:
-            return f"{first} {last}"
-        if first:
-            return first
-        if last:
-            return last
-        return self.uffd.get("displayname") or self.uffd.get("loginname")
 
-    @property
-    def image_url(self) -> str:
-        return f"/mm_avatar/{self.mm['id']}"
+def _parse_teams(groups: list[str]) -> tuple[TeamMembership, ...]:
+    user_groups = set(groups)
+    teams = []
+    for group in groups:
+        if group.startswith("team_"):
+            team_name = group[5:]
+            is_lead = f"moderation_{team_name}" in user_groups
+            teams.append(_team_membership(team_name, is_lead))
+    teams.sort(key=lambda x: x.team_name)
+    return tuple(teams)
 
-    @property
-    def username(self) -> str:
-        return self.uffd.get("loginname")
 
-    @property
-    def email(self) -> str:
-        return self.uffd.get("email")
+def _parse_custom_status(cs_str: str | None) -> tuple[MattermostCustomStatus | None, datetime.datetime | None]:
+    """Returns the custom status, and when it expires (None if it doesn't)."""
+    if not cs_str:
+        return None, None
+    try:
+        cs = json.loads(cs_str)
+    except json.JSONDecodeError:
+        return None, None
 
-    @property
-    def groups(self) -> list[str]:
-        return self.uffd.get("groups", [])
+    expires_at_str = cs.get("expires_at")
+    if not expires_at_str:
+        return cs, None
+    try:
+        expires_at = datetime.datetime.fromisoformat(expires_at_str)
+    except ValueError:
+        return None, None
+    if expires_at.year <= 2000:
+        return cs, None
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+    return cs, expires_at
 
-    @property
-    def teams(self) -> list[TeamMembership]:
-        teams = []
-        user_groups = set(self.groups)
-        for group in self.groups:
-            if group.startswith("team_"):
-                team_name = group[5:]
-                is_lead = f"moderation_{team_name}" in user_groups
-                teams.append(TeamMembership(team_name=team_name, is_lead=is_lead))
-        teams.sort(key=lambda x: x.team_name)
-        return teams
 
-    @property
-    def teams_json(self) -> str:
-        return json.dumps([asdict(team) for team in self.teams])
+def _custom_status_emoji_url(cs: MattermostCustomStatus | None) -> str | None:
+    if not cs or not cs.get("emoji"):
+        return None
+
+    emoji_name = cs["emoji"]
+
+    system_map = get_system_emoji_map()
+    if emoji_name in system_map:
+        unified = system_map[emoji_name]
+        return f"https://chat.orga.emfcamp.org/static/emoji/{unified.lower()}.png"
+
+    return f"/mm_emoji/{emoji_name}"
+
+
+def _display_name(uffd: UFFDUser, mm: MattermostUser) -> str:
+    first = mm.get("first_name")
+    last = mm.get("last_name")
+    if first and last:
+        return f"{first} {last}"
+    if first:
+        return first
+    if last:
+        return last
+    return uffd.get("displayname") or uffd.get("loginname")
+
+
+@dataclass(frozen=True, slots=True)
+class EnhancedUser:
+    """A directory entry, with everything the templates show derived up front from UFFD and Mattermost."""
+
+    username: str
+    email: str
+    display_name: str
+    mm_id: str
+    # Changes whenever the user's Mattermost profile picture does; 0 if they haven't uploaded one.
+    picture_version: int
+    position: str | None
+    teams: tuple[TeamMembership, ...]
+    teams_json: str
+    status: MattermostCustomStatus | None  # ignoring expiry; see custom_status
+    status_expires_at: datetime.datetime | None
+    status_emoji_url: str | None
+
+    @classmethod
+    def from_upstream(cls, uffd: UFFDUser, mm: MattermostUser) -> EnhancedUser:
+        teams = _parse_teams(uffd.get("groups", []))
+        status, status_expires_at = _parse_custom_status(mm.get("props", {}).get("customStatus"))
+        return cls(
+            username=uffd.get("loginname"),
+            email=uffd.get("email"),
+            display_name=_display_name(uffd, mm),
+            mm_id=mm["id"],
+            picture_version=mm.get("last_picture_update", 0),
+            position=mm.get("position"),
+            teams=teams,
+            teams_json=json.dumps([asdict(team) for team in teams]),
+            status=status,
+            status_expires_at=status_expires_at,
+            status_emoji_url=_custom_status_emoji_url(status),
+        )
+
+    def to_json(self) -> dict[str, typing.Any]:
+        return {
+            **asdict(self),
+            "status_expires_at": self.status_expires_at.isoformat() if self.status_expires_at else None,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, typing.Any]) -> EnhancedUser:
+        status_expires_at = data["status_expires_at"]
+        return cls(
+            username=data["username"],
+            email=data["email"],
+            display_name=data["display_name"],
+            mm_id=data["mm_id"],
+            picture_version=data["picture_version"],
+            position=data["position"],
+            teams=tuple(_team_membership(**team) for team in data["teams"]),
+            teams_json=data["teams_json"],
+            status=data["status"],
+            status_expires_at=datetime.datetime.fromisoformat(status_expires_at) if status_expires_at else None,
+            status_emoji_url=data["status_emoji_url"],
+        )
 
     @property
-    def position(self) -> str | None:
-        return self.mm.get("position")
+    def image_url(self) -> str:
+        if not self.picture_version:
+            # Mattermost generates a default picture from the username, which can change unversioned.
+            return f"/mm_avatar/{self.mm_id}"
+        return f"/mm_avatar/{self.mm_id}?v={self.picture_version}"
 
     @property
     def custom_status(self) -> MattermostCustomStatus | None:
-        props = self.mm.get("props", {})
-        cs_str = props.get("customStatus")
-        if not cs_str:
-            return None
-
-        try:
-            cs = json.loads(cs_str)
-            expires_at_str = cs.get("expires_at")
-            if expires_at_str:
-                try:
-                    expires_at = datetime.datetime.fromisoformat(expires_at_str)
-                    if expires_at.year > 2000 and expires_at < datetime.datetime.now(datetime.timezone.utc):
-                        return None
-                except ValueError:
-                    return None
-            return cs
-        except json.JSONDecodeError:
+        if self.status_expires_at and self.status_expires_at < datetime.datetime.now(datetime.timezone.utc):
             return None
+        return self.status
 
     @property
     def custom_status_emoji_url(self) -> str | None:
-        cs = self.custom_status
-        if not cs or not cs.get("emoji"):
+        if not self.custom_status:
             return None
+        return self.status_emoji_url
 
-        emoji_name = cs["emoji"]
 
-        system_map = get_system_emoji_map()
-        if emoji_name in system_map:
-            unified = system_map[emoji_name]
-            return f"https://chat.orga.emfcamp.org/static/emoji/{unified.lower()}.png"
-
-        return f"/mm_emoji/{emoji_name}"
+@dataclass(frozen=True)
+class Team:
+    name: str
+    leads: list[EnhancedUser]
+    members: list[EnhancedUser]
+    # Everyone not in the team, so that client-side filtering can switch teams without a reload.
+    others: list[EnhancedUser]
 
 
-async def fetch_directory_data(uffd_client: UFFDClient, mm_client: MattermostClient) -> dict[str, EnhancedUser]:
+@dataclass(frozen=True)
+class Directory:
+    users: dict[str, EnhancedUser]  # keyed by username
+    users_by_mm_id: dict[str, EnhancedUser]
+    sorted_users: list[EnhancedUser]  # by display name
+    teams: dict[str, Team]  # in team name order
+    # When custom statuses expire (as POSIX timestamps, sorted), changing what the pages show.
+    changes_at: list[float]
+    # Over sorted_users, by display name and username, then position and teams.
+    search_index: SearchIndex
+
+    @classmethod
+    def build(cls, users: Iterable[EnhancedUser]) -> Directory:
+        sorted_users = sorted(users, key=lambda u: u.display_name.lower())
+
+        memberships: dict[str, dict[str, bool]] = {}
+        for user in sorted_users:
+            for team in user.teams:
+                memberships.setdefault(team.team_name, {})[user.username] = team.is_lead
+
+        teams: dict[str, Team] = {}
+        for team_name in sorted(memberships):
+            team_members = memberships[team_name]
+            teams[team_name] = Team(
+                name=team_name,
+                leads=[u for u in sorted_users if team_members.get(u.username) is True],
+                members=[u for u in sorted_users if team_members.get(u.username) is False],
+                others=[u for u in sorted_users if u.username not in team_members],
+            )
+
+        return cls(
+            users={u.username: u for u in sorted_users},
+            users_by_mm_id={u.mm_id: u for u in sorted_users},
+            sorted_users=sorted_users,
+            teams=teams,
+            changes_at=sorted(u.status_expires_at.timestamp() for u in sorted_users if u.status_expires_at),
+            search_index=SearchIndex.build(
+                [
+                    ((u.display_name, u.username), (u.position or "", *(t.team_name for t in u.teams)))
+                    for u in sorted_users
+                ]
+            ),
+        )
+
+
+async def fetch_directory_data(uffd_client: UFFDClient, mm_client: MattermostClient) -> Directory:
     # Run async calls
     uffd_task = uffd_client.get_users()
-    mm_task = mm_client.get_all_active_users()
+    mm_task = mm_client.sync_active_users()
 
     uffd_users, mm_users = await asyncio.gather(uffd_task, mm_task)
 
     mm_map: dict[str, MattermostUser] = {}
     for mm_user in mm_users:
-        props = mm_user.get("props", {})
-        idp_id = props.get("idp/userid")
+        idp_id = _idp_user_id(mm_user)
         if idp_id:
             mm_map[idp_id] = mm_user
 
-    user_map: dict[str, EnhancedUser] = {}
+    users: list[EnhancedUser] = []
     for uffd_user in uffd_users:
         uffd_id_str = str(uffd_user.get("id"))
         mm_user = mm_map.get(uffd_id_str)
         if not mm_user:
             continue
 
-        user = EnhancedUser(uffd=uffd_user, mm=mm_user)
-        user_map[uffd_user["loginname"]] = user
+        users.append(EnhancedUser.from_upstream(uffd_user, mm_user))
+
+    return Directory.build(users)
+
+
+def dump_directory_data(directory: Directory) -> bytes:
+    return json.dumps([user.to_json() for user in directory.users.values()]).encode("utf-8")
+
+
+def load_directory_data(data: bytes) -> Directory:
+    return Directory.build(EnhancedUser.from_json(user) for user in json.loads(data))
+
+
+def dump_emoji_ids(emoji_ids: dict[str, str]) -> bytes:
+    return json.dumps(emoji_ids).encode("utf-8")
+
 
-    return user_map
+def load_emoji_ids(mm_client: MattermostClient, data: bytes) -> dict[str, str]:
+    """Loads emoji IDs prefetched by another process, caching them in `mm_client` as if it had fetched them."""
+    emoji_ids = json.loads(data)
+    mm_client.cache_emoji_ids(emoji_ids)
+    return emoji_ids
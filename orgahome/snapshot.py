@@ -0,0 +1,234 @@
+"""In-memory snapshots of slow upstream data."""
+
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import logging
+import os
+import pathlib
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# How long a process without a snapshot waits for the leader to write its first one.
+SHARED_SNAPSHOT_WAIT = 30.0
+
+
+def content_version(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+@dataclass(frozen=True)
+class Snapshot[T]:
+    data: T
+    fetched_at: float  # time.monotonic()
+    # Identifies the content; processes sharing a snapshot agree on it.
+    version: str
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class SharedSnapshotStore[T]:
+    """Shares a snapshot between processes through a file.
+
+    Whichever process manages to take the lock file is the leader: it is the only one that talks to
+    upstream, and it publishes each snapshot by atomically replacing the snapshot file. Everyone
+    else just loads whatever the leader last wrote. If the leader dies its lock is released and the
+    next process to refresh takes over.
+    """
+
+    def __init__(self, path: pathlib.Path, dump: Callable[[T], bytes], load: Callable[[bytes], T]) -> None:
+        self.path = path
+        self.lock_path = path.with_name(f"{path.name}.lock")
+        self.dump = dump
+        self.load = load
+        self._lock_fd: int | None = None
+        self._last_seen: tuple[int, int, int] | None = None
+
+    def acquire_leadership(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        logger.info(f"Process {os.getpid()} is now the leader for {self.path}")
+        self._lock_fd = fd
+        return True
+
+    def release_leadership(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def write(self, data: T) -> str:
+        """Stores a snapshot, returning its version."""
+        serialized = self.dump(data)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(serialized)
+        tmp_path.replace(self.path)
+        self._last_seen = self._stat_key()
+        return content_version(serialized)
+
+    def read(self) -> tuple[T, str] | None:
+        """Returns the stored snapshot and its version, or None if it hasn't changed since the last read/write."""
+        key = self._stat_key()
+        if key is None or key == self._last_seen:
+            return None
+        serialized = self.path.read_bytes()
+        self._last_seen = key
+        return self.load(serialized), content_version(serialized)
+
+    def _stat_key(self) -> tuple[int, int, int] | None:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class SnapshotCache[T]:
+    """Stale-while-revalidate cache around a single upstream fetch.
+
+    Once a snapshot exists, `get` never waits on upstream: a snapshot older than `ttl` is still
+    returned, and a refresh is kicked off in the background. At most one refresh is in flight at
+    a time, so any number of concurrent callers share a single upstream fetch.
+
+    With a `store`, only the process leading that store fetches from upstream; the others refresh
+    by loading the leader's latest snapshot instead. Snapshot versions then come from the stored
+    content; otherwise they come from `version`, or failing that a counter.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable[T]],
+        ttl: float,
+        store: SharedSnapshotStore[T] | None = None,
+        version: Callable[[T], str] | None = None,
+    ) -> None:
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.store = store
+        self.version = version
+        self._counter = itertools.count(1)
+        self._snapshot: Snapshot[T] | None = None
+        self._refresh_task: asyncio.Task[Snapshot[T]] | None = None
+
+    @property
+    def snapshot(self) -> Snapshot[T] | None:
+        return self._snapshot
+
+    async def get(self) -> T:
+        return (await self.get_snapshot()).data
+
+    async def get_snapshot(self) -> Snapshot[T]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Nothing to serve yet, so we have to wait (alongside everyone else).
+            snapshot = await self.refresh()
+        elif snapshot.age >= self.ttl:
+            self._start_refresh()
+        return snapshot
+
+    async def run_refresher(self, interval: float, jitter: float = 0.1, min_backoff: float = 1.0) -> None:
+        """Keep the snapshot fresh forever, refreshing roughly every `interval` seconds.
+
+        Each wait is randomly stretched or shrunk by up to `jitter` (as a fraction) so that many
+        processes don't all hit upstream at once. After a failure we retry sooner, starting at
+        `min_backoff` seconds and doubling up to `interval`.
+        """
+        failures = 0
+        try:
+            while True:
+                if failures:
+                    delay = min(interval, min_backoff * 2 ** (failures - 1))
+                elif self._snapshot is None:
+                    delay = 0
+                else:
+                    # Someone else may have refreshed recently; count from then.
+                    delay = max(0, interval - self._snapshot.age)
+                if delay:
+                    await asyncio.sleep(delay * random.uniform(1 - jitter, 1 + jitter))
+                try:
+                    await self.refresh()
+                    failures = 0
+                except Exception:
+                    failures += 1
+        finally:
+            if self._refresh_task is not None:
+                self._refresh_task.cancel()
+            if self.store is not None:
+                self.store.release_leadership()
+
+    @asynccontextmanager
+    async def background_refresh(self, interval: float, jitter: float = 0.1) -> AsyncIterator[None]:
+        task = asyncio.create_task(self.run_refresher(interval, jitter), name=f"refresher-{self.name}")
+        try:
+            yield
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def refresh(self) -> Snapshot[T]:
+        # Shield the shared task so that one cancelled caller doesn't cancel it for everyone.
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task[Snapshot[T]]:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._do_refresh(), name=f"refresh-{self.name}")
+            self._refresh_task.add_done_callback(self._refresh_done)
+        return self._refresh_task
+
+    def _refresh_done(self, task: asyncio.Task[Snapshot[T]]) -> None:
+        self._refresh_task = None
+        if not task.cancelled() and (e := task.exception()):
+            logger.error(f"Failed to refresh {self.name} snapshot: {e!r}")
+
+    async def _do_refresh(self) -> Snapshot[T]:
+        if self.store is None:
+            data = await self._fetch_upstream()
+            version = self.version(data) if self.version else str(next(self._counter))
+        else:
+            data, version = await self._refresh_shared(self.store)
+        snapshot = Snapshot(data=data, fetched_at=time.monotonic(), version=version)
+        self._snapshot = snapshot
+        return snapshot
+
+    async def _fetch_upstream(self) -> T:
+        start = time.monotonic()
+        data = await self.fetch()
+        logger.info(f"Refreshed {self.name} snapshot in {time.monotonic() - start:.3f}s")
+        return data
+
+    async def _refresh_shared(self, store: SharedSnapshotStore[T]) -> tuple[T, str]:
+        deadline = time.monotonic() + SHARED_SNAPSHOT_WAIT
+        while True:
+            if store.acquire_leadership():
+                data = await self._fetch_upstream()
+                version = await asyncio.to_thread(store.write, data)
+                return data, version
+
+            shared = await asyncio.to_thread(store.read)
+            if shared is not None:
+                logger.debug(f"Loaded shared {self.name} snapshot from {store.path}")
+                return shared
+            if self._snapshot is not None:
+                # The leader hasn't published anything new since we last looked.
+                return self._snapshot.data, self._snapshot.version
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No shared {self.name} snapshot appeared at {store.path}")
+            await asyncio.sleep(0.1)
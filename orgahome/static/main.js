@@ -1,18 +1,145 @@
-document.addEventListener("DOMContentLoaded", () => {
+function buildCard(user) {
+  // Mirrors the user_card macro in templates/components/user_card.html.
+  const el = (tag, className, text) => {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  };
+
+  const card = el("div", "user-card glass-card");
+  card.dataset.name = user.displayName;
+
+  if (user.statusEmojiUrl) {
+    const picture = el("picture", "status-emoji");
+    const source = el("source");
+    source.srcset = user.statusEmojiUrl;
+    source.media = "(prefers-reduced-motion: no-preference)";
+    const img = el("img");
+    img.src = `${user.statusEmojiUrl}?remove_animation=true`;
+    img.title = user.statusText || "";
+    picture.append(source, img);
+    card.append(picture);
+  }
+
+  const link = el("a", "card-link");
+  link.href = `/user/${encodeURIComponent(user.username)}`;
+  const header = el("div", "user-header");
+  const avatar = el("img", "profile-image");
+  avatar.src = user.imageUrl;
+  avatar.alt = user.displayName;
+  const info = el("div", "user-info");
+  info.append(
+    el("h2", "", user.displayName),
+    el("span", "user-username", `@${user.username}`),
+  );
+  header.append(avatar, info);
+  link.append(header);
+  card.append(link);
+
+  const details = el("div", "user-details");
+  if (user.position) details.append(el("div", "position-info", user.position));
+  if (user.teams.size > 0) {
+    const section = el("div", "groups-section");
+    const tags = el("div", "tags");
+    for (const [teamName, isLead] of user.teams) {
+      const tag = el(
+        "a",
+        `tag ${isLead ? "tag-lead" : ""} js-team-filter`,
+        isLead ? `${teamName} ★` : teamName,
+      );
+      tag.href = `/team/${teamName}`;
+      tag.title = isLead ? "Team Lead" : "Member";
+      tags.append(tag);
+    }
+    section.append(el("h3", "", "Teams"), tags);
+    details.append(section);
+  }
+  card.append(details);
+  return card;
+}
+
+async function loadEntriesFromApi(apiUrl) {
+  const response = await fetch(apiUrl, { credentials: "same-origin" });
+  if (!response.ok) throw new Error(`Failed to load directory: ${response.status}`);
+  const data = await response.json();
+  const columns = data.users;
+  return columns.username.map((username, i) => {
+    const leads = new Set(columns.leads[i]);
+    const user = {
+      username,
+      displayName: columns.display_name[i],
+      imageUrl: columns.image_url[i],
+      position: columns.position[i],
+      statusEmojiUrl: columns.status_emoji_url[i],
+      statusText: columns.status_text[i],
+      teams: new Map(columns.teams[i].map((t) => [data.teams[t], leads.has(t)])),
+    };
+    return {
+      card: buildCard(user),
+      name: user.displayName,
+      teams: user.teams,
+    };
+  });
+}
+
+function loadEntriesFromCards() {
+  // Parse each card's teams once up front, rather than on every filter change.
+  return Array.from(document.querySelectorAll(".user-card")).map((card) => ({
+    card,
+    name: card.dataset.name,
+    teams: new Map(
+      JSON.parse(card.dataset.teams).map((t) => [t.team_name, t.is_lead]),
+    ),
+  }));
+}
+
+document.addEventListener("DOMContentLoaded", async () => {
   const grid = document.getElementById("user-grid");
   if (!grid) return;
 
   const filterSelect = document.getElementById("team-filter");
   if (!filterSelect) return;
 
+  const teamFromUrl = () => {
+    const path = window.location.pathname;
+    if (path.startsWith("/team/")) {
+      return decodeURIComponent(path.substring(6));
+    }
+    return "all";
+  };
+
+  // Each entry is { card, name, teams: Map(team name -> is lead) }.
+  // In client rendering mode the server sends no cards; we build them from the API instead.
+  const apiUrl = grid.dataset.apiUrl;
+  let entries;
+  if (apiUrl) {
+    try {
+      entries = await loadEntriesFromApi(apiUrl);
+    } catch (err) {
+      // Without the API there is nothing to filter, so say so rather than leave an empty grid.
+      console.error(err);
+      const msg = document.createElement("div");
+      msg.textContent = "The directory could not be loaded. Please reload the page.";
+      msg.className = "empty-message";
+      grid.replaceChildren(msg);
+      return;
+    }
+  } else {
+    entries = loadEntriesFromCards();
+  }
+  const byName = (a, b) => a.name.localeCompare(b.name);
+
   // Show controls (progressive enhancement)
   const controls = document.querySelector(".header-controls");
   if (controls) controls.style.display = "flex";
 
-  // Store initial cards
-  const initialCards = Array.from(document.querySelectorAll(".user-card"));
+  const searchInput = document.getElementById("directory-search");
 
   function filterByTeam(selectedTeam) {
+    // Picking a team ends any search.
+    if (searchInput) searchInput.value = "";
+
     // Update select if needed (e.g. from back button or link click)
     if (filterSelect.value !== selectedTeam) {
       filterSelect.value = selectedTeam;
@@ -23,8 +150,8 @@ document.addEventListener("DOMContentLoaded", () => {
 
     if (selectedTeam === "all") {
       // Restore all cards, sorted by name
-      initialCards.sort((a, b) => a.dataset.name.localeCompare(b.dataset.name));
-      initialCards.forEach((card) => {
+      entries.sort(byName);
+      entries.forEach(({ card }) => {
         card.classList.remove("hidden-card"); // Ensure server-hidden cards are shown
         grid.appendChild(card);
       });
@@ -35,25 +162,22 @@ document.addEventListener("DOMContentLoaded", () => {
     const leads = [];
     const members = [];
 
-    initialCards.forEach((card) => {
-      const teams = JSON.parse(card.dataset.teams);
-      const teamInfo = teams.find((t) => t.team_name === selectedTeam);
-
-      if (teamInfo) {
-        card.classList.remove("hidden-card");
-        if (teamInfo.is_lead) {
-          leads.push(card);
+    entries.forEach((entry) => {
+      if (entry.teams.has(selectedTeam)) {
+        entry.card.classList.remove("hidden-card");
+        if (entry.teams.get(selectedTeam)) {
+          leads.push(entry);
         } else {
-          members.push(card);
+          members.push(entry);
         }
       } else {
-        card.classList.add("hidden-card");
+        entry.card.classList.add("hidden-card");
       }
     });
 
     // Sort each group
-    leads.sort((a, b) => a.dataset.name.localeCompare(b.dataset.name));
-    members.sort((a, b) => a.dataset.name.localeCompare(b.dataset.name));
+    leads.sort(byName);
+    members.sort(byName);
 
     // Append with Headers
     if (leads.length > 0) {
@@ -61,7 +185,7 @@ document.addEventListener("DOMContentLoaded", () => {
       header.className = "grid-header";
       header.textContent = "Team Leads";
       grid.appendChild(header);
-      leads.forEach((card) => grid.appendChild(card));
+      leads.forEach(({ card }) => grid.appendChild(card));
     }
 
     if (members.length > 0) {
@@ -69,7 +193,7 @@ document.addEventListener("DOMContentLoaded", () => {
       header.className = "grid-header";
       header.textContent = "Team Members";
       grid.appendChild(header);
-      members.forEach((card) => grid.appendChild(card));
+      members.forEach(({ card }) => grid.appendChild(card));
     }
 
     if (leads.length === 0 && members.length === 0) {
@@ -81,22 +205,51 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   // Initial state from URL
-  const updateStateFromUrl = () => {
-    const path = window.location.pathname;
-    let team = "all";
-    if (path.startsWith("/team/")) {
-      team = decodeURIComponent(path.substring(6));
-    }
-    // Set the dropdown initially without re-filtering if it matches (optimization),
-    // but for simplicity and correctness (to handle browser back/forward), running logic is safer.
-    // However, on initial load, the server already rendered the correct state.
-    // So we only update the dropdown.
+  if (apiUrl) {
+    // Nothing has been rendered yet.
+    filterByTeam(teamFromUrl());
+  } else {
+    // The server already rendered the correct state, so we only update the dropdown.
+    const team = teamFromUrl();
     if (filterSelect.value !== team) {
       filterSelect.value = team;
     }
-  };
+  }
 
-  updateStateFromUrl();
+  // Search as you type. The server holds an index of the directory, so we ask it for the
+  // matching cards rather than filtering everything here.
+  if (searchInput) {
+    let pending = null;
+    let timer = null;
+
+    const runSearch = async () => {
+      const query = searchInput.value.trim();
+      if (pending) pending.abort();
+      if (!query) {
+        pending = null;
+        filterByTeam(filterSelect.value);
+        return;
+      }
+
+      pending = new AbortController();
+      const url = `${searchInput.dataset.searchUrl}?q=${encodeURIComponent(query)}`;
+      try {
+        const response = await fetch(url, {
+          credentials: "same-origin",
+          signal: pending.signal,
+        });
+        if (!response.ok) return;
+        grid.innerHTML = await response.text();
+      } catch (err) {
+        if (err.name !== "AbortError") throw err;
+      }
+    };
+
+    searchInput.addEventListener("input", () => {
+      clearTimeout(timer);
+      timer = setTimeout(runSearch, 100);
+    });
+  }
 
   // Event Listeners
   filterSelect.addEventListener("change", function (e) {
@@ -109,13 +262,8 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   // Handle Back/Forward
-  window.addEventListener("popstate", (e) => {
-    const path = window.location.pathname;
-    let team = "all";
-    if (path.startsWith("/team/")) {
-      team = decodeURIComponent(path.substring(6));
-    }
-    filterByTeam(team);
+  window.addEventListener("popstate", () => {
+    filterByTeam(teamFromUrl());
   });
 
   // Handle Team Chip Clicks
@@ -2,27 +2,93 @@
 
 import abc
 import base64
+import concurrent.futures
+import dataclasses
+import email.utils
+import gzip
 import hashlib
 import json
+import mimetypes
 import os
 import pathlib
 import re
+import stat
 import typing
-from collections.abc import Collection, Iterable
+from collections.abc import Callable, Collection, Iterable
+from compression import zstd
 
+import anyio
+import brotli
 import jinja2
 import jinja2.runtime
 from starlette import staticfiles
+from starlette.datastructures import Headers
 from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
 from starlette.templating import Jinja2Templates
+from starlette.types import Scope
 
 STATIC_SOURCE_PATH = pathlib.Path(__file__).parent / "static"
-STATIC_COMPILED_PATH = pathlib.Path(__file__).parent / "dist"
+# Where compilestatic builds everything by default (ORGAHOME_DIST_ROOT elsewhere).
+DIST_PATH = pathlib.Path(__file__).parent / "dist"
+# The static files get their own directory under the dist root, since all of it is served; other
+# build outputs, like the compiled templates, go alongside it.
+STATIC_DIRNAME = "static"
+STATIC_COMPILED_PATH = DIST_PATH / STATIC_DIRNAME
 MANIFEST_FILENAME = ".staticmanifest.json"
+# Source file sizes and mtimes from the last build, so incremental builds can skip unchanged files.
+# Kept out of the manifest so that its hash (the site version) only depends on content.
+BUILD_CACHE_FILENAME = ".staticbuild.json"
 
 FILENAME_HASH_FUNC = hashlib.sha256
 FILENAME_HASH_LEN = FILENAME_HASH_FUNC().digest_size * 2
 
+# Files worth precompressing; everything else we serve (fonts, mostly) is compressed already.
+COMPRESSIBLE_SUFFIXES = frozenset({".css", ".js", ".svg", ".json", ".html", ".txt", ".map"})
+# Content-hashed paths never change, so browsers needn't ever revalidate them.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Hashed assets up to this size are kept in memory rather than read from disk for each request.
+IN_MEMORY_MAX_SIZE = 256 * 1024
+
+# Content codings, in the order we prefer them when a client accepts several.
+ENCODING_SUFFIXES = {"zstd": ".zst", "br": ".br", "gzip": ".gz"}
+
+
+def _compressors() -> dict[str, Callable[[bytes], bytes]]:
+    # These run once at build time, so use the slowest, smallest settings. gzip's mtime is fixed
+    # so that builds are reproducible.
+    return {
+        "zstd": lambda data: zstd.compress(data, level=19),
+        "br": lambda data: brotli.compress(data, quality=11),
+        "gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    }
+
+
+def negotiate_encoding(accept_encoding: str, available: Collection[str]) -> str | None:
+    """Picks which of the `available` content codings to send for an Accept-Encoding header, if any."""
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    for encoding in ENCODING_SUFFIXES:
+        if encoding in available and qualities.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
 
 class StaticFilesBase(abc.ABC):
     def __init__(self, static_route: str = "static"):
@@ -37,6 +103,11 @@ class StaticFilesBase(abc.ABC):
         templates.env.globals["static_url_for"] = static_url_for
         templates.env.globals["static_sri_hash"] = lambda path: self.get_sri_hash(path)
 
+    @property
+    @abc.abstractmethod
+    def version(self) -> str | None:
+        """Identifies the set of static files being served, or None if they can change at any time."""
+
     @abc.abstractmethod
     def hash_path(self, file: str) -> str | None:
         pass
@@ -49,18 +120,35 @@ class StaticFilesBase(abc.ABC):
     def get_sri_hash(self, file: str) -> str | None:
         pass
 
+    def encoded_variants(self, path: str) -> dict[str, str]:
+        """Returns the paths of precompressed copies of the file at hashed `path`, by content coding."""
+        return {}
 
-def hashed_filename(root: pathlib.Path, file: pathlib.PurePath) -> pathlib.PurePath:
-    filehash = FILENAME_HASH_FUNC((root / file).read_bytes()).hexdigest()
+    def is_immutable(self, path: str) -> bool:
+        """Whether the content served at `path` can never change."""
+        return False
+
+    def in_memory_asset(self, path: str) -> InMemoryAsset | None:
+        return None
+
+
+def _with_hash(file: pathlib.PurePath, filehash: str) -> pathlib.PurePath:
     return file.with_stem(f"{file.stem}.{filehash}")
 
 
+def hashed_filename(root: pathlib.Path, file: pathlib.PurePath) -> pathlib.PurePath:
+    return _with_hash(file, FILENAME_HASH_FUNC((root / file).read_bytes()).hexdigest())
+
+
 HASHED_STEM_REGEX = re.compile(r"^(.*)[.][a-z0-9]{" + str(FILENAME_HASH_LEN) + "}$")
 
 
+def _sri_from_digest(digest: bytes) -> str:
+    return f"sha256-{base64.b64encode(digest).decode('utf-8')}"
+
+
 def sri_hash(root: pathlib.Path, file: pathlib.PurePath) -> str:
-    filehash = hashlib.sha256((root / file).read_bytes()).digest()
-    return f"sha256-{base64.b64encode(filehash).decode('utf-8')}"
+    return _sri_from_digest(hashlib.sha256((root / file).read_bytes()).digest())
 
 
 def lookup_path(
@@ -83,25 +171,46 @@ class DevelopmentStaticFiles(StaticFilesBase):
     def __init__(self, static_dir: pathlib.Path = STATIC_SOURCE_PATH, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.static_dir = static_dir
+        # By requested path: the file on disk, its (mtime, size, inode) when hashed, hashed filename and SRI hash.
+        self._hashes: dict[str, tuple[str, tuple[int, int, int], str, str]] = {}
+
+    @property
+    def version(self) -> str | None:
+        return None
 
     def get_serving_directories(self) -> list[pathlib.Path]:
         return [self.static_dir]
 
-    def resolve_path(self, file: str) -> pathlib.PurePath | None:
+    def _file_hashes(self, file: str) -> tuple[str, str] | None:
+        """Returns the hashed filename and SRI hash for `file`, only rereading it if it has changed."""
+        cached = self._hashes.get(file)
+        if cached is not None:
+            disk_path, key, hashed_path, sri = cached
+            try:
+                file_stat = os.stat(disk_path)
+            except FileNotFoundError:
+                return None
+            if (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino) == key:
+                return hashed_path, sri
+
         resolved_path = self.static_dir.joinpath(file)
         try:
             relative_path = resolved_path.relative_to(self.static_dir)
-        except ValueError:
-            return None
-        if not resolved_path.exists():
+            file_stat = resolved_path.stat()
+        except ValueError, FileNotFoundError:
             return None
-        return relative_path
+        data = resolved_path.read_bytes()
+        filename_hash = FILENAME_HASH_FUNC(data)
+        sri_digest = filename_hash.digest() if FILENAME_HASH_FUNC is hashlib.sha256 else hashlib.sha256(data).digest()
+        hashed_path = str(_with_hash(relative_path, filename_hash.hexdigest()))
+        sri = _sri_from_digest(sri_digest)
+        key = (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino)
+        self._hashes[file] = (str(resolved_path), key, hashed_path, sri)
+        return hashed_path, sri
 
     def hash_path(self, file: str) -> str | None:
-        resolved_path = self.resolve_path(file)
-        if not resolved_path:
-            return None
-        return str(hashed_filename(self.static_dir, resolved_path))
+        hashes = self._file_hashes(file)
+        return hashes[0] if hashes else None
 
     def hashed_path_to_file(self, path: str) -> tuple[str, os.stat_result | None] | None:
         file = pathlib.PurePath(path)
@@ -113,15 +222,39 @@ class DevelopmentStaticFiles(StaticFilesBase):
         return lookup_path([self.static_dir], file_candidates)
 
     def get_sri_hash(self, file: str) -> str | None:
-        resolved_path = self.resolve_path(file)
-        if not resolved_path:
-            return None
-        return sri_hash(self.static_dir, resolved_path)
+        hashes = self._file_hashes(file)
+        return hashes[1] if hashes else None
+
+
+@dataclasses.dataclass(frozen=True)
+class InMemoryAsset:
+    body: bytes
+    headers: dict[str, str]
+
+    @classmethod
+    def load(cls, disk_path: pathlib.Path, path: str, encoding: str | None, has_variants: bool) -> InMemoryAsset:
+        body = disk_path.read_bytes()
+        media_type = mimetypes.guess_type(path)[0] or "text/plain"
+        if media_type.startswith("text/"):
+            media_type += "; charset=utf-8"
+        headers = {
+            "Content-Type": media_type,
+            "Content-Length": str(len(body)),
+            "Last-Modified": email.utils.formatdate(disk_path.stat().st_mtime, usegmt=True),
+            "ETag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        }
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if has_variants:
+            headers["Vary"] = "Accept-Encoding"
+        return cls(body=body, headers=headers)
 
 
 class ManifestEntry(typing.TypedDict):
     hashed_path: str
     sri_hash: str
+    encodings: typing.NotRequired[dict[str, str]]  # content coding -> path of the compressed copy
 
 
 class ManifestStaticFiles(StaticFilesBase):
@@ -136,41 +269,166 @@ class ManifestStaticFiles(StaticFilesBase):
         self.static_dir = static_dir
         self.serving_dir = serving_dir
         self.manifest = self.load_manifest()
+        self.variants = {
+            entry["hashed_path"]: entry["encodings"] for entry in self.manifest.values() if entry.get("encodings")
+        }
+        self.hashed_paths = {entry["hashed_path"] for entry in self.manifest.values()}
+        self.hashed_paths.update(path for variants in self.variants.values() for path in variants.values())
+        self.assets = self.load_assets()
 
     def get_serving_directories(self) -> list[pathlib.Path]:
         return [self.serving_dir, self.static_dir]
 
+    @property
+    def version(self) -> str | None:
+        return self.manifest_hash
+
     def load_manifest(self) -> dict[str, ManifestEntry]:
-        with open(self.serving_dir / MANIFEST_FILENAME) as f:
-            return json.load(f)
+        manifest_bytes = (self.serving_dir / MANIFEST_FILENAME).read_bytes()
+        self.manifest_hash = FILENAME_HASH_FUNC(manifest_bytes).hexdigest()
+        return json.loads(manifest_bytes)
 
     def hash_path(self, file: str) -> str | None:
         return self.manifest.get(file, {}).get("hashed_path")
 
     def hashed_path_to_file(self, path: str) -> tuple[str, os.stat_result | None] | None:
-        return lookup_path([self.serving_dir, self.static_dir], [pathlib.PurePath(path)])
+        # Only what the manifest lists, so that the manifest and other build files stay private.
+        directories = [self.serving_dir, self.static_dir] if path in self.hashed_paths else [self.static_dir]
+        return lookup_path(directories, [pathlib.PurePath(path)])
 
     def get_sri_hash(self, file: str) -> str | None:
         return self.manifest.get(file, {}).get("sri_hash")
 
+    def encoded_variants(self, path: str) -> dict[str, str]:
+        return self.variants.get(path, {})
+
+    def is_immutable(self, path: str) -> bool:
+        return path in self.hashed_paths
+
+    def in_memory_asset(self, path: str) -> InMemoryAsset | None:
+        return self.assets.get(path)
+
+    def load_assets(self) -> dict[str, InMemoryAsset]:
+        assets = {}
+        for entry in self.manifest.values():
+            hashed_path = entry["hashed_path"]
+            variants = entry.get("encodings", {})
+            for encoding, path in [(None, hashed_path), *variants.items()]:
+                disk_path = self.serving_dir / path
+                if disk_path.stat().st_size <= IN_MEMORY_MAX_SIZE:
+                    # Served with the type of the uncompressed file.
+                    asset = InMemoryAsset.load(disk_path, hashed_path, encoding, bool(variants))
+                    assets[path] = asset
+        return assets
+
+
+class _BuildCacheEntry(typing.TypedDict):
+    size: int
+    mtime_ns: int
+
+
+def _entry_outputs(entry: ManifestEntry) -> list[str]:
+    return [entry["hashed_path"], *entry.get("encodings", {}).values()]
+
+
+def _compile_static_file(
+    source_path: pathlib.Path,
+    dest_path: pathlib.Path,
+    relative_path: pathlib.PurePath,
+    compressors: dict[str, Callable[[bytes], bytes]],
+    previous: ManifestEntry | None,
+    previous_stat: _BuildCacheEntry | None,
+) -> tuple[ManifestEntry, _BuildCacheEntry]:
+    filepath = source_path / relative_path
+    file_stat = filepath.stat()
+    build_stat = _BuildCacheEntry(size=file_stat.st_size, mtime_ns=file_stat.st_mtime_ns)
+    if previous is not None and not all((dest_path / path).exists() for path in _entry_outputs(previous)):
+        previous = None
+    if previous is not None and previous_stat == build_stat:
+        return previous, build_stat
+
+    # Read and hash each file once: the SRI hash is also sha256, so the filename hash's digest does for both.
+    data = filepath.read_bytes()
+    filename_hash = FILENAME_HASH_FUNC(data)
+    sri_digest = filename_hash.digest() if FILENAME_HASH_FUNC is hashlib.sha256 else hashlib.sha256(data).digest()
+    hashed_name = _with_hash(relative_path, filename_hash.hexdigest())
+    if previous is not None and previous["hashed_path"] == str(hashed_name):
+        return previous, build_stat  # touched, but not changed
+
+    entry = ManifestEntry(hashed_path=str(hashed_name), sri_hash=_sri_from_digest(sri_digest))
+    target_filepath = dest_path / hashed_name
+    target_filepath.parent.mkdir(parents=True, exist_ok=True)
+    target_filepath.write_bytes(data)
+
+    if filepath.suffix in COMPRESSIBLE_SUFFIXES:
+        encodings = {}
+        for encoding, compress in compressors.items():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue  # tiny files can grow
+            encoded_name = hashed_name.with_name(hashed_name.name + ENCODING_SUFFIXES[encoding])
+            (dest_path / encoded_name).write_bytes(compressed)
+            encodings[encoding] = str(encoded_name)
+        if encodings:
+            entry["encodings"] = encodings
+    return entry, build_stat
+
 
 def compile_static_files(
-    source_path: pathlib.Path = STATIC_SOURCE_PATH, dest_path: pathlib.Path = STATIC_COMPILED_PATH
+    source_path: pathlib.Path = STATIC_SOURCE_PATH,
+    dest_path: pathlib.Path = STATIC_COMPILED_PATH,
+    incremental: bool = False,
+    max_workers: int | None = None,
 ) -> None:
-    manifest = {}
-    for dirpath, dirnames, filenames in source_path.walk():
-        for filename in filenames:
-            filepath = dirpath / filename
-            relative_to_source_root = pathlib.PurePath(filepath.relative_to(source_path))
-            hashed_name = hashed_filename(source_path, relative_to_source_root)
-            manifest[str(relative_to_source_root)] = ManifestEntry(
-                hashed_path=str(hashed_name), sri_hash=sri_hash(source_path, relative_to_source_root)
+    """Copies static files into `dest_path` under content-hashed names, with compressed copies and a manifest.
+
+    Files are processed in parallel (hashing and compression mostly release the GIL). With
+    `incremental`, files whose size and mtime (or failing that, content) match the previous build
+    in `dest_path` are skipped, and outputs of files that have since changed or gone are removed.
+    """
+    previous_manifest: dict[str, ManifestEntry] = {}
+    previous_stats: dict[str, _BuildCacheEntry] = {}
+    if incremental:
+        try:
+            previous_manifest = json.loads((dest_path / MANIFEST_FILENAME).read_bytes())
+            previous_stats = json.loads((dest_path / BUILD_CACHE_FILENAME).read_bytes())
+        except FileNotFoundError:
+            pass
+
+    relative_paths = [
+        pathlib.PurePath((dirpath / filename).relative_to(source_path))
+        for dirpath, dirnames, filenames in source_path.walk()
+        for filename in filenames
+    ]
+    compressors = _compressors()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(
+            executor.map(
+                lambda relative_path: _compile_static_file(
+                    source_path,
+                    dest_path,
+                    relative_path,
+                    compressors,
+                    previous_manifest.get(str(relative_path)),
+                    previous_stats.get(str(relative_path)),
+                ),
+                relative_paths,
             )
-            target_filepath = dest_path / hashed_name
-            target_filepath.parent.mkdir(parents=True, exist_ok=True)
-            filepath.copy(target_filepath)
+        )
+
+    manifest = {str(relative_path): entry for relative_path, (entry, _) in zip(relative_paths, results)}
+    build_stats = {str(relative_path): stat for relative_path, (_, stat) in zip(relative_paths, results)}
+
+    current_outputs = {path for entry in manifest.values() for path in _entry_outputs(entry)}
+    for entry in previous_manifest.values():
+        for path in _entry_outputs(entry):
+            if path not in current_outputs:
+                (dest_path / path).unlink(missing_ok=True)
+
     with open(dest_path / MANIFEST_FILENAME, "w") as f:
         json.dump(manifest, f, indent=2)
+    with open(dest_path / BUILD_CACHE_FILENAME, "w") as f:
+        json.dump(build_stats, f, indent=2)
 
 
 class StaticFilesServer(staticfiles.StaticFiles):
@@ -183,3 +441,37 @@ class StaticFilesServer(staticfiles.StaticFiles):
         if not result:
             return "", None
         return result
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        variants = self.static_files.encoded_variants(path)
+        encoding = negotiate_encoding(request_headers.get("accept-encoding", ""), variants) if variants else None
+        served_path = path if encoding is None else variants[encoding]
+
+        if scope["method"] in ("GET", "HEAD") and (asset := self.static_files.in_memory_asset(served_path)):
+            if self.is_not_modified(Headers(asset.headers), request_headers):
+                return NotModifiedResponse(Headers(asset.headers))
+            # Content-Length is already set, so HEAD gets the right one without a body.
+            return Response(asset.body if scope["method"] == "GET" else b"", headers=asset.headers)
+
+        if encoding is not None and scope["method"] in ("GET", "HEAD"):
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, served_path)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                response = FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    media_type=mimetypes.guess_type(path)[0],
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+                )
+                if self.static_files.is_immutable(served_path):
+                    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+
+        response = await super().get_response(path, scope)
+        if variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        if self.static_files.is_immutable(path):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
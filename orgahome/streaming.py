@@ -0,0 +1,51 @@
+"""Streamed rendering of large templates."""
+
+import asyncio
+import typing
+from collections.abc import AsyncIterator, Iterator
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.templating import Jinja2Templates
+
+# Send the first chunk (with the <head>, so the browser can start fetching CSS) early, then let the
+# chunks grow so that big pages aren't sent in thousands of tiny pieces.
+FIRST_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 64 * 1024
+
+
+async def _coalesce(pieces: Iterator[str]) -> AsyncIterator[bytes]:
+    buffer: list[str] = []
+    buffered = 0
+    chunk_size = FIRST_CHUNK_SIZE
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= chunk_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer.clear()
+            buffered = 0
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+            # Rendering is synchronous, so let other requests run between chunks.
+            await asyncio.sleep(0)
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def template_stream(
+    request: Request,
+    name: str,
+    context: dict[str, typing.Any],
+    headers: typing.Mapping[str, str] | None = None,
+) -> StreamingResponse:
+    """Like `templates.TemplateResponse`, but sends the page as it renders rather than all at once.
+
+    Errors part way through can't change the status any more, so this is only for pages whose
+    data has already been fetched.
+    """
+    templates: Jinja2Templates = request.state.templates
+    template = templates.get_template(name)  # fail while we can still send an error page
+    context = {"request": request, **context}
+    for processor in templates.context_processors:
+        context.update(processor(request))
+    return StreamingResponse(_coalesce(template.generate(context)), media_type="text/html", headers=headers)
@@ -0,0 +1,69 @@
+"""Jinja environment setup, shared by the app and the template precompiler."""
+
+import datetime
+import pathlib
+import zlib
+
+import jinja2
+from starlette.templating import Jinja2Templates
+
+TEMPLATES_SOURCE_PATH = pathlib.Path(__file__).parent / "templates"
+# Under the dist root, next to the compiled static files rather than among them, where they'd be served.
+COMPILED_TEMPLATES_DIRNAME = ".templates"
+
+
+def _friendly_date(x: datetime.datetime) -> str:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ago = now - x
+    if ago.days < 1:
+        return x.strftime("%H:%M")
+    else:
+        return x.strftime("%Y-%m-%d %H:%M")
+
+
+_SATURATIONS = [0.35, 0.5, 0.65]
+_LIGHTNESSES = [0.55, 0.65, 0.75]
+
+
+def _color_hash(val: str) -> str:
+    # Not hash(), which is seeded differently in every process: pages are served with strong ETags,
+    # so every worker has to render the same colours.
+    h = zlib.crc32(val.encode("utf-8"))
+    hue = h % 359
+    sat = _SATURATIONS[int(h / 360 % len(_SATURATIONS))]
+    lightness = _LIGHTNESSES[int(h / 360 / len(_SATURATIONS) % len(_LIGHTNESSES))]
+    return f"hsl({hue}, {sat * 100}%, {lightness * 100}%)"
+
+
+def make_environment(loader: jinja2.BaseLoader) -> jinja2.Environment:
+    """Creates the Jinja environment templates are compiled with.
+
+    Filters are resolved when a template is compiled, so precompiled templates must come from an
+    environment made here too.
+    """
+    env = jinja2.Environment(loader=loader, autoescape=jinja2.select_autoescape())
+    env.filters["from_iso"] = lambda x: datetime.datetime.fromisoformat(x)
+    env.filters["friendly_date"] = _friendly_date
+    env.filters["color_hash"] = _color_hash
+    return env
+
+
+def make_templates(compiled_dir: pathlib.Path | None = None) -> Jinja2Templates:
+    """Loads precompiled templates from `compiled_dir` if given, or compiles them from source as they're used."""
+    loader: jinja2.BaseLoader
+    if compiled_dir is not None:
+        loader = jinja2.ModuleLoader(compiled_dir)
+    else:
+        loader = jinja2.FileSystemLoader(TEMPLATES_SOURCE_PATH)
+    return Jinja2Templates(env=make_environment(loader))
+
+
+def warm_templates(templates: Jinja2Templates) -> None:
+    """Loads every template now, rather than on the first request that needs it."""
+    for name in jinja2.FileSystemLoader(TEMPLATES_SOURCE_PATH).list_templates():
+        templates.get_template(name)
+
+
+def compile_templates(dest_path: pathlib.Path, source_path: pathlib.Path = TEMPLATES_SOURCE_PATH) -> None:
+    env = make_environment(jinja2.FileSystemLoader(source_path))
+    env.compile_templates(dest_path, zip=None, ignore_errors=False)
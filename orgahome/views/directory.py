@@ -1,56 +1,49 @@
+import json
+import typing
+
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from starlette.responses import Response
 
-from orgahome.services import EnhancedUser, MattermostClient, UFFDClient, fetch_directory_data
+from orgahome import conditional, streaming
+from orgahome.config import Config
+from orgahome.services import Directory, EnhancedUser
+from orgahome.snapshot import SnapshotCache
 
 
 async def index(request: Request) -> Response:
     team_name = request.path_params.get("team_name")
-    user_map = await fetch_directory_data(UFFDClient.from_request(request), MattermostClient.from_request(request))
-    enhanced_users = list(user_map.values())
-    all_teams: set[str] = set()
-
-    for user in enhanced_users:
-        for team in user.teams:
-            all_teams.add(team.team_name)
+    directory_cache: SnapshotCache[Directory] = request.state.directory_cache
+    snapshot = await directory_cache.get_snapshot()
+    directory = snapshot.data
 
-    # Sort users alphabetically by default
-    enhanced_users.sort(key=lambda u: u.display_name.lower())
-
-    sorted_teams = sorted(list(all_teams))
+    client_rendering = Config.DIRECTORY_CLIENT_RENDERING
+    etag = conditional.page_etag(request, snapshot, directory.changes_at, team_name, client_rendering)
+    if response := conditional.not_modified(request, etag):
+        return response
 
     leads: list[EnhancedUser] = []
     members: list[EnhancedUser] = []
-    others: list[EnhancedUser] = []
-
-    if team_name:
-        for user in enhanced_users:
-            # Check if user is in the team
-            team_info = next((t for t in user.teams if t.team_name == team_name), None)
-            if team_info:
-                if team_info.is_lead:
-                    leads.append(user)
-                else:
-                    members.append(user)
-            else:
-                others.append(user)
-    else:
-        leads = []
-        members = []
-        others = enhanced_users
+    others: list[EnhancedUser] = directory.sorted_users
 
-    return request.state.templates.TemplateResponse(
+    if team_name and (team := directory.teams.get(team_name)):
+        leads = team.leads
+        members = team.members
+        others = team.others
+
+    return streaming.template_stream(
         request,
         "index.html",
         {
-            "users": enhanced_users,
+            "users": directory.sorted_users,
             "leads": leads,
             "members": members,
             "others": others,
-            "teams": sorted_teams,
+            "teams": list(directory.teams),
             "selected_team": team_name,
+            "client_rendering": client_rendering,
         },
+        headers=conditional.cache_headers(etag),
     )
 
 
@@ -59,9 +52,108 @@ async def user_detail(request: Request) -> Response:
     if not username or not isinstance(username, str):
         raise HTTPException(status_code=404)
 
-    user_map = await fetch_directory_data(UFFDClient.from_request(request), MattermostClient.from_request(request))
-    user = user_map.get(username)
+    directory_cache: SnapshotCache[Directory] = request.state.directory_cache
+    snapshot = await directory_cache.get_snapshot()
+    user = snapshot.data.users.get(username)
     if not user:
         raise HTTPException(status_code=404)
 
-    return request.state.templates.TemplateResponse(request, "user.html", {"user": user})
+    etag = conditional.page_etag(request, snapshot, snapshot.data.changes_at, username)
+    if response := conditional.not_modified(request, etag):
+        return response
+
+    return request.state.templates.TemplateResponse(
+        request, "user.html", {"user": user}, headers=conditional.cache_headers(etag)
+    )
+
+
+def _directory_columns(directory: Directory) -> dict[str, typing.Any]:
+    """Lays the directory out column by column, which is much smaller than one object per user.
+
+    Each user's teams are indexes into the team list; "leads" holds the subset they lead.
+    """
+    team_index = {team_name: i for i, team_name in enumerate(directory.teams)}
+    users = directory.sorted_users
+    statuses = [user.custom_status for user in users]
+    return {
+        "teams": list(directory.teams),
+        "users": {
+            "username": [user.username for user in users],
+            "display_name": [user.display_name for user in users],
+            "image_url": [user.image_url for user in users],
+            "position": [user.position or None for user in users],
+            "status_emoji_url": [user.custom_status_emoji_url for user in users],
+            "status_text": [status.get("text") if status else None for status in statuses],
+            "teams": [[team_index[team.team_name] for team in user.teams] for user in users],
+            "leads": [[team_index[team.team_name] for team in user.teams if team.is_lead] for user in users],
+        },
+    }
+
+
+async def directory_api(request: Request) -> Response:
+    directory_cache: SnapshotCache[Directory] = request.state.directory_cache
+    snapshot = await directory_cache.get_snapshot()
+
+    etag = conditional.page_etag(request, snapshot, snapshot.data.changes_at)
+    if response := conditional.not_modified(request, etag):
+        return response
+
+    data = {"version": 1, **_directory_columns(snapshot.data)}
+    return Response(
+        json.dumps(data, separators=(",", ":")),
+        media_type="application/json",
+        headers=conditional.cache_headers(etag),
+    )
+
+
+_SEARCH_LIMIT = 50
+
+
+async def _search(request: Request) -> tuple[str, list[EnhancedUser], str | None]:
+    directory_cache: SnapshotCache[Directory] = request.state.directory_cache
+    snapshot = await directory_cache.get_snapshot()
+    directory = snapshot.data
+
+    query = request.query_params.get("q", "")
+    etag = conditional.page_etag(request, snapshot, directory.changes_at, query)
+    results = [directory.sorted_users[i] for i in directory.search_index.search(query, limit=_SEARCH_LIMIT)]
+    return query, results, etag
+
+
+async def search(request: Request) -> Response:
+    """Renders the user cards matching the "q" query parameter, as a fragment to drop into the grid."""
+    query, results, etag = await _search(request)
+    if response := conditional.not_modified(request, etag):
+        return response
+
+    return request.state.templates.TemplateResponse(
+        request,
+        "search_results.html",
+        {"query": query, "users": results},
+        headers=conditional.cache_headers(etag),
+    )
+
+
+async def search_api(request: Request) -> Response:
+    query, results, etag = await _search(request)
+    if response := conditional.not_modified(request, etag):
+        return response
+
+    data = {
+        "query": query,
+        "users": [
+            {
+                "username": user.username,
+                "display_name": user.display_name,
+                "image_url": user.image_url,
+                "position": user.position or None,
+                "teams": [team.team_name for team in user.teams],
+            }
+            for user in results
+        ],
+    }
+    return Response(
+        json.dumps(data, separators=(",", ":")),
+        media_type="application/json",
+        headers=conditional.cache_headers(etag),
+    )
@@ -1,48 +1,136 @@
+import functools
 import logging
+import math
+from collections.abc import AsyncIterator
+from typing import BinaryIO
 
 import aiohttp
+import anyio
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, Response, StreamingResponse
 
-from orgahome import gif, services
+from orgahome import conditional, gif, services
+from orgahome.config import Config
+from orgahome.imagecache import CachedImage, FetchedImage, ImageCache, ImageFetcher, ImageFetchError
 
 logger = logging.getLogger(__name__)
 
 
-async def mm_url_proxy(request: Request, url: str, remove_animation: bool = False) -> Response:
-    session: aiohttp.ClientSession = request.state.client_session
+# Mattermost's own limits on avatar and emoji uploads are well below this.
+MAX_IMAGE_SIZE = 8 * 1024 * 1024
+# For URLs that name a version of the image, so a different image always has a different URL.
+VERSIONED_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+async def _fetch_image(
+    session: aiohttp.ClientSession,
+    url: str,
+    headers: dict[str, str],
+    cached: CachedImage | None,
+) -> FetchedImage | None:
+    request_headers = dict(headers)
+    if cached is not None and cached.etag:
+        request_headers["If-None-Match"] = cached.etag
+    if cached is not None and cached.last_modified:
+        request_headers["If-Modified-Since"] = cached.last_modified
+
+    async with session.get(url, headers=request_headers) as resp:
+        if resp.status == 304 and cached is not None:
+            return None
+        if resp.status != 200:
+            raise ImageFetchError(resp.status)
+
+        body = bytearray()
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) > MAX_IMAGE_SIZE:
+                logger.error(f"Image at {url} is over {MAX_IMAGE_SIZE} bytes")
+                raise ImageFetchError(502)
+        return FetchedImage(
+            body=bytes(body),
+            content_type=resp.headers.get("Content-Type", "application/octet-stream"),
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+        )
+
+
+async def _chunks(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def _fetch_deanimated(
+    image_cache: ImageCache,
+    key: str,
+    fetch: ImageFetcher,
+    fresh_for: float | None,
+    cached: CachedImage | None,
+) -> FetchedImage | None:
+    """Derives the first frame from the cached original image, so the GIF is only parsed when that changes."""
+    original, body = await image_cache.get(key, fetch, fresh_for=fresh_for)
+    # The original's digest stands in for the upstream validators.
+    if cached is not None and cached.etag == original.digest:
+        return None
+    if body is None:
+        original, body = await image_cache.read_body(key, original, fetch, fresh_for=fresh_for)
+    if original.content_type.startswith("image/gif"):
+        body = b"".join([chunk async for chunk in gif.deanimate(_chunks(body))])
+    return FetchedImage(body=body, content_type=original.content_type, etag=original.digest)
+
+
+def _image_headers(image: CachedImage, image_cache: ImageCache, versioned_url: bool) -> dict[str, str]:
+    etag = f'"{image.digest}"'
+    if versioned_url:
+        return {"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL}
+    return {"ETag": etag, "Cache-Control": f"private, max-age={int(image_cache.fresh_for)}"}
+
+
+async def _read_file(file: BinaryIO) -> AsyncIterator[bytes]:
+    with file:
+        while chunk := await anyio.to_thread.run_sync(file.read, 64 * 1024):
+            yield chunk
+
+
+async def mm_url_proxy(
+    request: Request,
+    url: str,
+    remove_animation: bool = False,
+    version: str | None = None,
+    versioned_url: bool = False,
+) -> Response:
+    """Serves the image at `url` from the image cache.
+
+    With a `version`, the image at `url` is taken never to change: once cached it isn't
+    revalidated. If the URL of this request names that version too (`versioned_url`), browsers are
+    told they can keep it.
+    """
+    image_cache: ImageCache = request.state.image_cache
+    fetch: ImageFetcher = functools.partial(
+        _fetch_image, request.state.client_session, url, request.state.mm_client.headers
+    )
+    key = url if version is None else f"{url}?v={version}"
+    fresh_for = None if version is None else math.inf
+    if remove_animation:
+        fetch = functools.partial(_fetch_deanimated, image_cache, key, fetch, fresh_for)
+        key += "#remove_animation"
     try:
-        resp = await session.get(url, headers=request.state.mm_client.headers)
+        image, body = await image_cache.get(key, fetch, fresh_for=fresh_for)
+        headers = _image_headers(image, image_cache, versioned_url)
+        if response := conditional.not_modified(request, headers["ETag"], headers):
+            return response
+        if body is None:
+            # The blob could be evicted before we'd get round to sending it, unless it's already open.
+            image, body = await image_cache.open_blob(key, image, fetch, fresh_for=fresh_for)
+            headers = _image_headers(image, image_cache, versioned_url)
+    except ImageFetchError as e:
+        return Response("Error fetching image", status_code=e.status)
     except aiohttp.ClientError as e:
         logger.error(f"Error fetching URL {url}: {e}")
         return Response("Error fetching image", status_code=502)
 
-    if resp.status != 200:
-        resp.close()
-        return Response("Error fetching image", status_code=resp.status)
-
-    excluded_headers = {
-        "content-encoding",
-        "content-length",
-        "transfer-encoding",
-        "connection",
-    }
-    headers = {k.lower(): v for k, v in resp.headers.items() if k.lower() not in excluded_headers}
-
-    async def content_iter():
-        try:
-            stream = resp.content.iter_chunked(1024)
-
-            if remove_animation and headers.get("content-type", "").startswith("image/gif"):
-                stream = gif.deanimate(stream)
-
-            async for chunk in stream:
-                yield chunk
-        finally:
-            resp.close()
-            # Do not close the shared session
-
-    return StreamingResponse(content_iter(), status_code=resp.status, headers=headers)
+    if isinstance(body, bytes):
+        return Response(body, media_type=image.content_type, headers=headers)
+    headers["Content-Length"] = str(image.size)
+    return StreamingResponse(_read_file(body), media_type=image.content_type, headers=headers)
 
 
 async def mm_emoji_proxy(request: Request) -> Response:
@@ -56,7 +144,11 @@ async def mm_emoji_proxy(request: Request) -> Response:
             return Response("Not found", status_code=404)
 
         url = mm_client.get_custom_emoji_image_url(emoji_id)
-        return await mm_url_proxy(request, url, request.query_params.get("remove_animation") == "true")
+        # Custom emoji can't be edited, only deleted and added again with a new ID, so the ID versions
+        # the image. The name can move to another ID though, so browsers still have to revalidate.
+        return await mm_url_proxy(
+            request, url, request.query_params.get("remove_animation") == "true", version=emoji_id
+        )
     except Exception as e:
         logger.error(f"Failed to proxy emoji {emoji_name}: {e}")
         return Response("Error", status_code=500)
@@ -68,8 +160,22 @@ async def mm_avatar_proxy(request: Request) -> Response:
     if not user_id or not isinstance(user_id, str):
         return Response("Invalid user ID", status_code=400)
     try:
+        directory: services.Directory = await request.state.directory_cache.get()
+        # Every card on a directory page has an avatar, so keep that many in memory (as well as emoji).
+        image_cache: ImageCache = request.state.image_cache
+        image_cache.reserve_memory(len(directory.users) + Config.IMAGE_CACHE_MEMORY_ITEMS)
+
         url = mm_client.get_user_image_url(user_id)
-        return await mm_url_proxy(request, url)
+        # EnhancedUser.image_url adds the picture version, so a new picture gets a new URL. Only trust
+        # it if it's the version we know of, otherwise anyone could pin whatever picture a user has now
+        # under any version they like.
+        user = directory.users_by_mm_id.get(user_id)
+        version = request.query_params.get("v")
+        if user is None or version is None:
+            return await mm_url_proxy(request, url)
+        if version != str(user.picture_version) or not user.picture_version:
+            return RedirectResponse(user.image_url)
+        return await mm_url_proxy(request, url, version=version, versioned_url=True)
     except Exception as e:
         logger.error(f"Failed to proxy image for {user_id}: {e}")
         # Redirect to default